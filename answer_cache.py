@@ -0,0 +1,131 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Replayed cache hits are streamed in pieces of about this many characters
+REPLAY_CHUNK_CHARS = 24
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variations share a key."""
+    text = re.sub(r"\s+", " ", (question or "").lower()).strip()
+    return text.rstrip("?!. ")
+
+
+def content_hash(text):
+    """Short stable hash of the loaded catalog, used as the catalog version."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question, catalog_version, history=None):
+    """
+    Key for an answer. Follow-up questions depend on the conversation, so any
+    history is hashed into the key as well.
+    """
+    key = f"{catalog_version}:{normalize_question(question)}"
+    if history:
+        key += ":" + content_hash("\n".join(f"{m['role']}:{m['content']}" for m in history if m.get("content")))
+    return key
+
+
+def replay_chunks(answer, size=REPLAY_CHUNK_CHARS):
+    """Split a cached answer into stream-sized chunks, breaking after whitespace where possible."""
+    start = 0
+    while start < len(answer):
+        end = min(start + size, len(answer))
+        if end < len(answer):
+            space = answer.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield answer[start:end]
+        start = end
+
+
+class AnswerCache:
+    """
+    Interface for answer caches.
+    Keys are built with cache_key(), so a catalog change yields new keys and
+    old answers are never served for a different catalog.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def contains(self, key):
+        """Whether `key` has a live answer, without counting a hit or miss."""
+        raise NotImplementedError
+
+    def set(self, key, answer):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryAnswerCache(AnswerCache):
+    """
+    LRU answer cache with a TTL and bounds on both entry count and total answer size.
+    Thread-safe, so it can be shared by the API workers' threads and the event loop.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, key):
+        answer, _ = self.entries.pop(key)
+        self.size_bytes -= len(answer.encode("utf-8"))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def contains(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[1] >= time.monotonic()
+
+    def set(self, key, answer):
+        size = len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (answer, time.monotonic() + self.ttl_seconds)
+            self.size_bytes += size
+            # Evict least recently used entries until both bounds hold
+            while self.entries and (len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,133 @@
+"""
+Compare applying a one-product catalog update with rebuilding from scratch.
+
+Copies the catalog sources to a temporary directory, builds a snapshot with
+the hybrid retriever (BM25 plus the on-disk vector index), then repeatedly
+edits one product (its description in product_catalog.md and in
+anton_products.json, plus its JSON price) and times:
+
+  incremental  CatalogSnapshot.build(previous=...): only the changed
+               product is re-indexed and re-embedded
+  full         CatalogSnapshot.build() with no previous snapshot and no
+               saved vector index
+
+Component timings (BM25 catalog index, vector index) are reported too, and
+both results are checked to return the same search results.
+
+    python benchmarks/catalog_update_benchmark.py --repeats 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = ("product_catalog.md", "anton_products.json", "anton_products.csv")
+QUERIES = ["roofing sheet colours", "water tank 1000 litres", "screw price", "pvc gutter", "door lock"]
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def edit_product(index, marker):
+    """Change one product's description in both the markdown and the JSON, and its JSON price."""
+    with open("anton_products.json", "r", encoding="utf-8") as file:
+        products = json.load(file)
+    product = products[index % len(products)]
+    url = product["url"]
+    data = product["product_data"]
+    data["product_description"] = (data.get("product_description") or "") + f" {marker}"
+    data["main_product_price"] = (data.get("main_product_price") or 0) + 1
+    with open("anton_products.json", "w", encoding="utf-8") as file:
+        json.dump(products, file, indent=2)
+
+    with open("product_catalog.md", "r", encoding="utf-8") as file:
+        lines = file.read().split("\n")
+    for number, line in enumerate(lines):
+        if line.startswith(f"| {url} |"):
+            # Cells: url, product_name, product_category, description, ...
+            cells = line.split(" | ")
+            cells[3] += f" {marker}"
+            lines[number] = " | ".join(cells)
+    with open("product_catalog.md", "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
+    return url
+
+
+def same_results(first, second):
+    return all([(chunk.key, round(score, 5)) for chunk, score in first.rag.retriever.search(query, 8)]
+               == [(chunk.key, round(score, 5)) for chunk, score in second.rag.retriever.search(query, 8)]
+               for query in QUERIES)
+
+
+def run(repeats):
+    from catalog_index import CatalogIndex
+    from catalog_snapshot import CatalogSnapshot
+    from vector_index import DEFAULT_INDEX_DIR, HashingEmbedder, VectorIndex, load_product_records
+
+    def build(previous=None):
+        return CatalogSnapshot.build(*SOURCES, retriever="hybrid", previous=previous)
+
+    timings = {name: [] for name in ("incremental", "full", "bm25_incremental", "bm25_full",
+                                     "vectors_incremental", "vectors_full")}
+    consistent = True
+    current = build()
+    for repeat in range(repeats):
+        # Spread the edits over the catalog; the marker is a word no other product has
+        edit_product(repeat * 37 + 5, f"zzupdate{repeat}")
+        with open("product_catalog.md", "r", encoding="utf-8") as file:
+            markdown = file.read()
+        records = load_product_records("anton_products.json")
+
+        _, seconds = timed(current.rag.catalog_index.updated, markdown)
+        timings["bm25_incremental"].append(seconds)
+        _, seconds = timed(CatalogIndex, markdown)
+        timings["bm25_full"].append(seconds)
+        _, seconds = timed(current.rag.retriever.vector_index.updated, records)
+        timings["vectors_incremental"].append(seconds)
+        _, seconds = timed(VectorIndex.build, records, HashingEmbedder())
+        timings["vectors_full"].append(seconds)
+
+        incremental, seconds = timed(build, current)
+        timings["incremental"].append(seconds)
+        shutil.rmtree(DEFAULT_INDEX_DIR)
+        full, seconds = timed(build)
+        timings["full"].append(seconds)
+
+        consistent = consistent and incremental.changes.get("catalog") == {"added": 0, "changed": 1, "removed": 0}
+        consistent = consistent and same_results(incremental, full)
+        current = incremental
+
+    return {
+        "repeats": repeats,
+        "milliseconds_median": {name: round(statistics.median(values) * 1000, 2) for name, values in timings.items()},
+        "speedup": round(statistics.median(timings["full"]) / statistics.median(timings["incremental"]), 2),
+        "last_changes": current.changes,
+        "revision": current.revision,
+        "results_match_full_rebuild": consistent,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_PROVIDER", "mock")
+    sys.path.insert(0, REPO_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in SOURCES:
+            shutil.copy(os.path.join(REPO_DIR, name), tmp)
+        os.chdir(tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run(args.repeats)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,59 @@
+"""
+Check that every product in the catalog reaches the prompt when asked about by name.
+
+For each product, asks ProductRAG.select_context for "Tell me about <name>" with
+the default retrieval settings (RAG_TOP_K, RAG_MAX_CONTEXT_TOKENS) and reports
+the products that were not selected. Products with many variants are bigger
+than the whole context budget and must be cut down, not dropped.
+
+    python benchmarks/context_check.py --catalog product_catalog.md
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(catalog):
+    from catalog_snapshot import CatalogSnapshot
+
+    snapshot = CatalogSnapshot.build(catalog, "anton_products.json", "anton_products.csv")
+    rag = snapshot.rag
+    chunks = [chunk for chunk in rag.catalog_index.chunks if not chunk.key.startswith(("text-", "section-"))]
+    titles = {}
+    for chunk in chunks:
+        titles.setdefault(chunk.title, []).append(chunk.key)
+
+    missing = []
+    for title, keys in titles.items():
+        context = rag.select_context(f"Tell me about {title}")
+        selected = {chunk.key for chunk in context.chunks}
+        # Several products sharing a name: any of them answers the question
+        if not selected & set(keys):
+            missing.append({"product": title, "selected": context.products, "context_tokens": context.tokens})
+    return {
+        "catalog": catalog,
+        "products": len(chunks),
+        "max_context_tokens": rag.max_context_tokens,
+        "oversized": sorted(chunk.title for chunk in chunks if chunk.tokens > rag.max_context_tokens),
+        "missing": missing,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--catalog", default="product_catalog.md")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_PROVIDER", "mock")
+    os.environ.setdefault("CATALOG_WATCH", "0")
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run(args.catalog)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["missing"] else 0)
@@ -0,0 +1,275 @@
+"""
+Check that a client disconnecting mid-answer stops the upstream LLM stream,
+and that a client reconnecting with Last-Event-ID resumes the answer.
+
+Serves the app with uvicorn inside this process (a real socket is needed
+for the server to see the disconnect), with a slow mock LLM. Scenarios:
+
+  single   one client reads a few frames and hangs up; after the resume grace
+           period (--grace) the mock must stop producing tokens within --bound
+           seconds, the upstream slot must be released and the partial answer
+           stored with status "truncated"
+  shared   two clients ask the same question (single-flight); one hangs up,
+           the other must still receive and store the complete answer
+  all      both clients of a shared stream hang up; upstream must stop
+  resume   a client hangs up and reconnects with Last-Event-ID; it must get
+           exactly the rest of the answer, with no second upstream call
+  websocket the same resume over /api/ws (drop the socket, resume on a new
+           one), then a cancel: the answer must end incomplete, upstream must
+           stop within --bound and the answer be stored as truncated
+
+    python benchmarks/disconnect_check.py --bound 1.0 --grace 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import httpx
+import uvicorn
+import websockets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TokenCounter:
+    """Wraps the mock provider to count the tokens it has produced so far."""
+
+    def __init__(self, provider):
+        self.tokens = 0
+        original = provider.stream
+
+        async def counting(*args, **kwargs):
+            async for token in original(*args, **kwargs):
+                self.tokens += 1
+                yield token
+
+        provider.stream = counting
+
+
+async def create(client, question):
+    return (await client.post("/api/messages", json={"content": question})).json()
+
+
+async def read_events(client, created, max_frames=None, last_event_id=None):
+    """
+    Read the stream; stop (closing the connection) after max_frames content frames.
+    Returns the text received and the id of the last event.
+    """
+    frames = []
+    headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+    event_id = last_event_id
+    async with client.stream("GET", f"/api/messages/{created['message_id']}/stream",
+                             params={"chat_id": created["chat_id"]}, headers=headers) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("id: "):
+                event_id = int(line[4:])
+            elif line.startswith("data: {"):
+                content = json.loads(line[6:]).get("content")
+                if content:
+                    frames.append(content)
+                    if max_frames is not None and len(frames) >= max_frames:
+                        break
+    return "".join(frames), event_id
+
+
+async def read_answer(client, created, max_frames=None):
+    return (await read_events(client, created, max_frames))[0]
+
+
+async def stored_message(client, created):
+    chat = (await client.get(f"/api/chats/{created['chat_id']}")).json()
+    return next(m for m in chat["messages"] if m["id"] == created["message_id"])
+
+
+async def wait_for_stop(counter, bound):
+    """Seconds until the token count stops growing, or None if it still grows after `bound`."""
+    started = time.monotonic()
+    last = counter.tokens
+    while time.monotonic() - started < bound + 0.5:
+        await asyncio.sleep(0.1)
+        if counter.tokens == last:
+            # Stable for a whole tick: make sure it stays that way
+            await asyncio.sleep(0.3)
+            if counter.tokens == last:
+                return round(time.monotonic() - started - 0.4, 3)
+        last = counter.tokens
+    return None
+
+
+async def scenario_single(base_url, main, counter, bound, grace):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        created = await create(client, "Tell me about roofing sheets (single)")
+        partial = await read_answer(client, created, max_frames=3)
+    await asyncio.sleep(grace)
+    stop = await wait_for_stop(counter, bound)
+    await asyncio.sleep(0.2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        message = await stored_message(client, created)
+    problems = []
+    if stop is None or stop > bound:
+        problems.append(f"upstream still producing after {bound}s")
+    if main.upstream_limiter.in_flight != 0:
+        problems.append("upstream slot not released")
+    if message.get("status") != "truncated" or not message["content"].startswith(partial):
+        problems.append(f"partial answer not stored as truncated: {message}")
+    return {"scenario": "single", "stop_seconds": stop, "stored_chars": len(message["content"]),
+            "status": message.get("status"), "problems": problems}
+
+
+async def scenario_shared(base_url, main, counter, bound, expected):
+    question = "Tell me about water tanks (shared)"
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        first, second = await create(client, question), await create(client, question)
+        full, partial = await asyncio.gather(read_answer(client, first),
+                                             read_answer(client, second, max_frames=3))
+        message = await stored_message(client, first)
+    problems = []
+    if full != expected or message["content"] != expected or message.get("status") is not None:
+        problems.append("remaining client did not get the complete answer")
+    return {"scenario": "shared", "full_chars": len(full), "partial_chars": len(partial), "problems": problems}
+
+
+async def scenario_all(base_url, main, counter, bound, grace):
+    question = "Tell me about PVC pipes (all)"
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        first, second = await create(client, question), await create(client, question)
+        await asyncio.gather(read_answer(client, first, max_frames=2), read_answer(client, second, max_frames=4))
+    await asyncio.sleep(grace)
+    stop = await wait_for_stop(counter, bound)
+    problems = []
+    if stop is None or stop > bound:
+        problems.append(f"upstream still producing after {bound}s")
+    return {"scenario": "all", "stop_seconds": stop, "problems": problems}
+
+
+async def scenario_resume(base_url, main, provider, grace):
+    question = "Tell me about door locks (resume)"
+    expected = provider.answer([{"role": "user", "content": question}])
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        created = await create(client, question)
+        before, event_id = await read_events(client, created, max_frames=3)
+        calls = provider.calls
+        # Reconnect well within the grace period, as a browser EventSource would
+        await asyncio.sleep(grace / 2)
+        after, _ = await read_events(client, created, last_event_id=event_id)
+        message = await stored_message(client, created)
+    problems = []
+    if before + after != expected:
+        problems.append("resumed stream did not continue where the first one stopped")
+    if provider.calls != calls:
+        problems.append("resuming started a new upstream call")
+    if message["content"] != expected or message.get("status") is not None:
+        problems.append(f"resumed answer not stored complete: {message}")
+    return {"scenario": "resume", "before_chars": len(before), "after_chars": len(after),
+            "last_event_id": event_id, "problems": problems}
+
+
+async def read_socket(socket, until, text=""):
+    """Read /api/ws messages, adding up answer text, until `until(message)` is true; returns (text, message, last id)."""
+    last_id = None
+    while True:
+        message = json.loads(await socket.recv())
+        if message["type"] == "event":
+            last_id = message["id"]
+            text += message["data"].get("content", "")
+        if until(message):
+            return text, message, last_id
+
+
+async def scenario_websocket(base_url, main, provider, counter, bound, grace):
+    question = "Tell me about garden hoses (websocket)"
+    expected = provider.answer([{"role": "user", "content": question}])
+    url = base_url.replace("http", "ws", 1) + "/api/ws"
+    async with websockets.connect(url) as socket:
+        await socket.send(json.dumps({"type": "message", "content": question}))
+        _, created, _ = await read_socket(socket, lambda m: m["type"] == "created")
+        before, _, last_id = await read_socket(socket, lambda m: m["type"] == "event" and m["id"] >= 4)
+    calls = provider.calls
+    async with websockets.connect(url) as socket:
+        await socket.send(json.dumps({"type": "resume", "chat_id": created["chat_id"],
+                                      "message_id": created["message_id"], "last_event_id": last_id}))
+        text, done, _ = await read_socket(socket, lambda m: m["type"] == "done", before)
+        resumed_calls = provider.calls
+
+        await socket.send(json.dumps({"type": "message", "chat_id": created["chat_id"],
+                                      "content": "Tell me about wheelbarrows (websocket cancel)"}))
+        _, cancelled, _ = await read_socket(socket, lambda m: m["type"] == "created")
+        await read_socket(socket, lambda m: m["type"] == "event" and m["id"] >= 3)
+        await socket.send(json.dumps({"type": "cancel", "chat_id": cancelled["chat_id"],
+                                      "message_id": cancelled["message_id"]}))
+        _, cancel_done, _ = await read_socket(socket, lambda m: m["type"] == "done")
+    stop = await wait_for_stop(counter, bound)
+    await asyncio.sleep(0.2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        message = await stored_message(client, cancelled)
+    problems = []
+    if text != expected or not done["complete"] or resumed_calls != calls:
+        problems.append("websocket resume did not continue the same answer")
+    if cancel_done["complete"]:
+        problems.append("cancelled answer reported complete")
+    if stop is None or stop > bound:
+        problems.append(f"upstream still producing {bound}s after cancel")
+    if message.get("status") != "truncated":
+        problems.append(f"cancelled answer not stored as truncated: {message}")
+    return {"scenario": "websocket", "resumed_chars": len(text) - len(before), "cancel_stop_seconds": stop,
+            "problems": problems}
+
+
+async def run(bound, grace):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            "LLM_PROVIDER": "mock", "MOCK_LLM_TTFT": "0.05", "MOCK_LLM_TOKENS_PER_SECOND": "40",
+            "MOCK_LLM_ANSWER_TOKENS": "400", "ANSWER_CACHE_TTL": "0", "CATALOG_WATCH": "0",
+            "CHAT_STORE": "sqlite", "CHAT_DB_PATH": os.path.join(tmp, "chats.db"), "SSE_COALESCE_MS": "30",
+            "RESUME_GRACE_SECONDS": str(grace),
+        })
+        sys.path.insert(0, REPO_DIR)
+        os.chdir(REPO_DIR)
+        import main
+
+        provider = main.catalog.current.rag.llm.providers[0]
+        counter = TokenCounter(provider)
+        expected = provider.answer([{"role": "user", "content": "Tell me about water tanks (shared)"}])
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.05)
+            try:
+                results = [
+                    await scenario_single(base_url, main, counter, bound, grace),
+                    await scenario_shared(base_url, main, counter, bound, expected),
+                    await scenario_all(base_url, main, counter, bound, grace),
+                    await scenario_resume(base_url, main, provider, grace),
+                    await scenario_websocket(base_url, main, provider, counter, bound, grace),
+                ]
+            finally:
+                server.should_exit = True
+                await serving
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bound", type=float, default=1.0, help="seconds allowed for upstream to stop")
+    parser.add_argument("--grace", type=float, default=0.5, help="seconds a stream keeps going with no client")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.bound, args.grace))
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if any(result["problems"] for result in results) else 0)
@@ -0,0 +1,86 @@
+"""
+Measure the faceted pre-filter on filter-style questions.
+
+Builds a catalog snapshot and, for each question, reports how it is routed
+(fast-path list answer or LLM), the filter parsed from it, and the catalog
+context sent to the LLM with and without the pre-filter (tokens and products).
+Also times parsing and matching a filter against the columnar arrays.
+
+    python benchmarks/facet_benchmark.py --repeats 2000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "roofing sheets under Rs 10,000 in royal blue",
+    "Show me pressure fittings above Rs 5000 in stock",
+    "list water tanks between 20k and 40,000 LKR",
+    "which products come in emerald green?",
+    "show out of stock products",
+    "What is the warranty on water tanks?",
+    "Tell me about PVC doors in pink",
+    "which gutters cost 500 or less",
+    "roofing accessories under Rs 3000 in royal blue",
+    "pipes under 25mm",
+    "tanks over 1000L",
+]
+
+
+def run(repeats):
+    from catalog_snapshot import CatalogSnapshot
+
+    snapshot = CatalogSnapshot.build("product_catalog.md", "anton_products.json", "anton_products.csv")
+    rag, facets = snapshot.rag, snapshot.rag.facets
+    rows = []
+    for question in QUESTIONS:
+        facet_filter = facets.parse(question)
+        decision = snapshot.router.route(question)
+        filtered = rag.select_context(question)
+        rag.facets = None
+        unfiltered = rag.select_context(question)
+        rag.facets = facets
+        rows.append({
+            "question": question,
+            "filter": facet_filter.describe(),
+            "matches": len(facets.match(facet_filter)) if not facet_filter.empty else None,
+            "route": decision.source,
+            "context_tokens": {"filtered": filtered.tokens, "unfiltered": unfiltered.tokens},
+            "context_products": {"filtered": len(filtered.chunks), "unfiltered": len(unfiltered.chunks)},
+        })
+
+    timings = {"parse": [], "match": []}
+    for _ in range(repeats):
+        for question in QUESTIONS:
+            started = time.perf_counter()
+            facet_filter = facets.parse(question)
+            parsed = time.perf_counter()
+            facets.match(facet_filter)
+            timings["parse"].append(parsed - started)
+            timings["match"].append(time.perf_counter() - parsed)
+    return {
+        "rows": len(facets.row_price),
+        "products": len(facets.product_stock),
+        "microseconds_median": {name: round(statistics.median(values) * 1e6, 1) for name, values in timings.items()},
+        "questions": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_PROVIDER", "mock")
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(REPO_DIR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run(args.repeats)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,358 @@
+"""
+End-to-end load and latency benchmark for the chat API.
+
+Each request runs the real flow: POST /api/messages, then read the SSE
+stream from GET /api/messages/{id}/stream until [DONE] (or, with
+--flow single, one POST /api/messages/stream). The LLM is the
+offline mock (LLM_PROVIDER=mock), so no network access is needed.
+
+By default the app is served by uvicorn inside the benchmark process,
+on the same event loop as the clients, so event-loop lag and RSS of
+the serving process can be measured (client work is included in both).
+With --server the app runs in a separate uvicorn process instead; lag
+is then not measured and RSS is the server's.
+
+Load is either closed-loop (--concurrency clients sending back to back)
+or open-loop (--rate new requests per second, Poisson arrivals).
+CPU time is reported per request; in-process it includes the clients.
+
+    python benchmarks/load_benchmark.py --requests 200 --concurrency 20
+    python benchmarks/load_benchmark.py --requests 300 --rate 30 --server --output run.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Open questions go to the (mock) LLM; lookups are answered by the fast path
+LLM_QUESTIONS = [
+    "Which roofing sheets work best near the sea?",
+    "Which water tanks would suit a small house?",
+    "Do you sell anything for garden irrigation?",
+    "What are the options for PVC pipes and fittings?",
+]
+FAST_PATH_QUESTIONS = ["price of 95185", "price of 95188", "link for the ridge unit"]
+
+LAG_INTERVAL = 0.01
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+    pick = lambda fraction: round(values[min(len(values) - 1, int(fraction * len(values)))], 4)
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 4),
+            "mean": round(sum(values) / len(values), 4)}
+
+
+def rss_bytes(pid="self"):
+    """Resident set size from /proc (Linux); None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def cpu_seconds(pid=None):
+    """User + system CPU time of this process, or of another process via /proc (Linux)."""
+    if pid is None:
+        return time.process_time()
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def benchmark_env(args, db_path):
+    """Environment for the app under test: mock LLM, no catalog watcher, chosen chat store."""
+    env = {
+        "LLM_PROVIDER": "mock",
+        "MOCK_LLM_TTFT": str(args.ttft),
+        "MOCK_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "MOCK_LLM_ANSWER_TOKENS": str(args.answer_tokens),
+        "MOCK_LLM_ERROR_RATE": str(args.error_rate),
+        "CATALOG_WATCH": "0",
+        "CHAT_STORE": args.store,
+        "CHAT_DB_PATH": db_path,
+    }
+    if not args.cache:
+        env["ANSWER_CACHE_TTL"] = "0"
+    if args.coalesce_ms is not None:
+        env["SSE_COALESCE_MS"] = str(args.coalesce_ms)
+    return env
+
+
+class LagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the event loop was blocked."""
+
+    def __init__(self, interval=LAG_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+def open_stream(client, created):
+    return client.stream("GET", f"/api/messages/{created['message_id']}/stream",
+                         params={"chat_id": created["chat_id"]})
+
+
+async def one_request(client, question, flow="two_step"):
+    """Create a message and stream its answer; returns a result dict with timings."""
+    started = time.perf_counter()
+    result = {"ok": False, "status": None, "ttft": None, "latency": None, "frames": 0, "chars": 0}
+    try:
+        if flow == "single":
+            stream = client.stream("POST", "/api/messages/stream", json={"content": question})
+        else:
+            created = await client.post("/api/messages", json={"content": question})
+            result["status"] = created.status_code
+            if created.status_code != 200:
+                return result
+            stream = open_stream(client, created.json())
+        async with stream as response:
+            result["status"] = response.status_code
+            if response.status_code != 200:
+                return result
+            async for line in response.aiter_lines():
+                if line == "data: [DONE]":
+                    result["ok"] = True
+                    break
+                if not line.startswith("data: "):
+                    continue
+                content = json.loads(line[6:]).get("content")
+                if content:
+                    if result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - started
+                    result["frames"] += 1
+                    result["chars"] += len(content)
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    finally:
+        result["latency"] = time.perf_counter() - started
+    return result
+
+
+def pick_question(index, rng, fast_path_share):
+    if rng.random() < fast_path_share:
+        return FAST_PATH_QUESTIONS[index % len(FAST_PATH_QUESTIONS)]
+    # A request number keeps questions distinct, so the answer cache and single-flight don't hide the LLM path
+    return f"{LLM_QUESTIONS[index % len(LLM_QUESTIONS)]} (request {index})"
+
+
+async def drive(client, args):
+    rng = random.Random(args.seed)
+    questions = [pick_question(i, rng, args.fast_path_share) for i in range(args.requests)]
+    results = []
+
+    if args.rate:
+        # Open loop: arrivals don't wait for earlier requests to finish
+        tasks = []
+        for question in questions:
+            tasks.append(asyncio.create_task(one_request(client, question, args.flow)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        results = await asyncio.gather(*tasks)
+    else:
+        queue = iter(questions)
+
+        async def worker():
+            for question in queue:
+                results.append(await one_request(client, question, args.flow))
+
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    return results
+
+
+def client_for(base_url, args):
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100))
+    return httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits)
+
+
+async def run_in_process(args):
+    # httpx's ASGITransport buffers whole responses, so the app is served over a
+    # real socket to measure time to first token
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(REPO_DIR)
+    import main
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    rss_before = rss_bytes()
+    cpu_before = cpu_seconds()
+    monitor = LagMonitor()
+    # The app logs every prompt budget; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                serving.result()
+            await asyncio.sleep(0.05)
+        try:
+            async with client_for(f"http://127.0.0.1:{port}", args) as client:
+                monitor.start()
+                started = time.perf_counter()
+                results = await drive(client, args)
+                elapsed = time.perf_counter() - started
+                await monitor.stop()
+        finally:
+            server.should_exit = True
+            await serving
+    return results, elapsed, cpu_seconds() - cpu_before, monitor.samples, rss_before, rss_bytes()
+
+
+async def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                if (await client.get("/api/health")).status_code == 200:
+                    return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def run_server(args, env):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=REPO_DIR, env={**os.environ, **env}, stdout=subprocess.DEVNULL)
+    try:
+        await wait_until_ready(base_url)
+        rss_before = rss_bytes(server.pid)
+        cpu_before = cpu_seconds(server.pid)
+        async with client_for(base_url, args) as client:
+            started = time.perf_counter()
+            results = await drive(client, args)
+            elapsed = time.perf_counter() - started
+        rss_after = rss_bytes(server.pid)
+        cpu_after = cpu_seconds(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return results, elapsed, cpu, None, rss_before, rss_after
+
+
+def report(args, results, elapsed, cpu, lag_samples, rss_before, rss_after):
+    ok = [r for r in results if r["ok"]]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "mode": "server" if args.server else "in_process",
+        "config": {
+            "requests": args.requests,
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "fast_path_share": args.fast_path_share,
+            "store": args.store,
+            "cache": args.cache,
+            "mock_ttft": args.ttft,
+            "mock_tokens_per_second": args.tokens_per_second,
+            "mock_answer_tokens": args.answer_tokens,
+            "mock_error_rate": args.error_rate,
+            "coalesce_ms": args.coalesce_ms,
+            "flow": args.flow,
+        },
+        "seconds": round(elapsed, 3),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "statuses": statuses,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "ttft_seconds": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_seconds": percentiles([r["latency"] for r in ok]),
+        "frames_per_answer": percentiles([r["frames"] for r in ok]),
+        "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "cpu_ms_per_request": round(cpu * 1000 / len(results), 3) if cpu is not None and results else None,
+        "event_loop_lag_seconds": percentiles(lag_samples) if lag_samples else None,
+        "rss_bytes": {
+            "before": rss_before,
+            "after": rss_after,
+            "growth": rss_after - rss_before if rss_before and rss_after else None,
+        },
+    }
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = benchmark_env(args, os.path.join(tmp, "chats.db"))
+        if args.server:
+            outcome = await run_server(args, env)
+        else:
+            os.environ.update(env)
+            outcome = await run_in_process(args)
+    return report(args, *outcome)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10, help="closed-loop clients (ignored with --rate)")
+    parser.add_argument("--rate", type=float, default=None, help="open-loop arrivals per second")
+    parser.add_argument("--fast-path-share", type=float, default=0.2)
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="sqlite")
+    parser.add_argument("--cache", action="store_true", help="keep the answer cache enabled")
+    parser.add_argument("--server", action="store_true", help="run uvicorn on localhost instead of in-process")
+    parser.add_argument("--ttft", type=float, default=0.3, help="mock LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--coalesce-ms", type=float, default=None,
+                        help="SSE coalescing window for the app (default: the app's own setting)")
+    parser.add_argument("--flow", choices=["two_step", "single"], default="two_step",
+                        help="POST then GET the stream, or the single send-and-stream request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    sys.exit(0 if result["failed"] == 0 else 1)
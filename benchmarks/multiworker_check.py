@@ -0,0 +1,129 @@
+"""
+Check that the API works with several uvicorn workers sharing one chat store.
+
+Starts `uvicorn main:app --workers N` on a free port with a temporary SQLite
+database, then runs many concurrent conversations over fresh connections, so
+creating a message and streaming its answer usually land on different
+workers. The questions are product-code lookups answered by the fast path,
+so no LLM or network access is needed.
+
+    python benchmarks/multiworker_check.py --workers 4 --conversations 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = ["price of 95185", "price of 95188", "what colors does the Screw come in", "link for the ridge unit"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, db_path):
+    env = {**os.environ, "LLM_PROVIDER": "mock", "CHAT_STORE": "sqlite", "CHAT_DB_PATH": db_path, "CATALOG_WATCH": "0"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_DIR, env=env)
+
+
+async def wait_until_ready(base_url, workers, timeout=60):
+    """Wait until the server answers and, ideally, every worker has been seen."""
+    deadline = time.monotonic() + timeout
+    pids = set()
+    while time.monotonic() < deadline:
+        try:
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                pids.add((await client.get("/api/health")).json()["pid"])
+            if len(pids) >= workers:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1 if pids else 0.5)
+    if not pids:
+        raise RuntimeError("server did not start")
+
+
+async def conversation(base_url, question):
+    """One create + stream + read-back round, each request on a new connection."""
+    pids = set()
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        created = (await client.post("/api/messages", json={"content": question})).json()
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        pids.add((await client.get("/api/health")).json()["pid"])
+        content = []
+        done = False
+        async with client.stream("GET", f"/api/messages/{created['message_id']}/stream",
+                                 params={"chat_id": created["chat_id"]}) as response:
+            if response.status_code != 200:
+                return False, pids, f"stream returned {response.status_code}"
+            async for line in response.aiter_lines():
+                if line == "data: [DONE]":
+                    done = True
+                elif line.startswith("data: "):
+                    content.append(json.loads(line[6:]).get("content", ""))
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        pids.add((await client.get("/api/health")).json()["pid"])
+        chat = (await client.get(f"/api/chats/{created['chat_id']}")).json()
+    stored = chat["messages"][-1]["content"] if chat.get("messages") else ""
+    if not done or not "".join(content) or stored != "".join(content):
+        return False, pids, "answer missing or not stored"
+    return True, pids, ""
+
+
+async def run(workers, conversations, concurrency):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(port, workers, os.path.join(tmp, "chats.db"))
+        try:
+            await wait_until_ready(base_url, workers)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(i):
+                async with semaphore:
+                    return await conversation(base_url, QUESTIONS[i % len(QUESTIONS)])
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[limited(i) for i in range(conversations)])
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    failures = [error for ok, _, error in results if not ok]
+    pids = set().union(*(result_pids for _, result_pids, _ in results))
+    return {
+        "workers": workers,
+        "conversations": conversations,
+        "failures": len(failures),
+        "errors": sorted(set(failures)),
+        "workers_seen": len(pids),
+        "seconds": round(elapsed, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.workers, args.conversations, args.concurrency))
+    print(json.dumps(report, indent=2))
+    ok = report["failures"] == 0 and (args.workers == 1 or report["workers_seen"] > 1)
+    sys.exit(0 if ok else 1)
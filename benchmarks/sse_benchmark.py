@@ -0,0 +1,45 @@
+"""
+Compare SSE streaming with and without token coalescing.
+
+Runs the load benchmark against a separate uvicorn process (so CPU time
+is the server's alone) once per coalescing window, with a fast mock LLM
+that emits one short word per token, and prints frames per answer and
+server CPU per stream for each.
+
+    python benchmarks/sse_benchmark.py --requests 200 --concurrency 20 --windows 0 30
+"""
+import argparse
+import asyncio
+import json
+
+from load_benchmark import run
+
+
+def compare(args):
+    rows = []
+    for window in args.windows:
+        run_args = argparse.Namespace(
+            requests=args.requests, concurrency=args.concurrency, rate=None, fast_path_share=0.0,
+            store="memory", cache=False, server=True, ttft=0.05, tokens_per_second=args.tokens_per_second,
+            answer_tokens=args.answer_tokens, error_rate=0.0, coalesce_ms=window, flow="two_step", seed=0)
+        result = asyncio.run(run(run_args))
+        rows.append({
+            "coalesce_ms": window,
+            "completed": result["completed"],
+            "frames_per_answer": result["frames_per_answer"]["mean"] if result["frames_per_answer"] else None,
+            "cpu_ms_per_stream": result["cpu_ms_per_request"],
+            "ttft_p50": result["ttft_seconds"]["p50"] if result["ttft_seconds"] else None,
+            "latency_p50": result["latency_seconds"]["p50"] if result["latency_seconds"] else None,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--answer-tokens", type=int, default=300)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 30], help="coalescing windows in ms")
+    args = parser.parse_args()
+    print(json.dumps(compare(args), indent=2))
@@ -0,0 +1,126 @@
+"""
+Compare the Streamlit app's per-session backend with the shared one.
+
+Simulates --sessions browser sessions, each on its own thread (as Streamlit
+runs scripts), all asking a question at the same moment, with the offline
+mock LLM. Each mode runs in a fresh Python process so memory is comparable:
+
+  per_session  the old behaviour: every session loads the catalog into its
+               own RAGBackend and LLM client, streams with asyncio.run and
+               redraws on every token with a 10 ms sleep
+  shared       one cached backend and one background event loop for the
+               process, redraws throttled to STREAMLIT_UI_UPDATE_MS
+
+Reports RSS growth over the run (the backends stay referenced, as session
+state keeps them), time to first redraw and to the full answer per session,
+and redraws per answer.
+
+    python benchmarks/streamlit_benchmark.py --sessions 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from load_benchmark import REPO_DIR, percentiles, rss_bytes
+
+MODES = ("per_session", "shared")
+
+
+def run_mode(mode, sessions):
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(REPO_DIR)
+    with contextlib.redirect_stderr(io.StringIO()):
+        import streamlit_app
+
+    path = streamlit_app.CATALOG_PATH
+    rss_before = rss_bytes()
+    barrier = threading.Barrier(sessions)
+    # Session state lives as long as the browser tab, so per-session backends stay referenced
+    session_state = [None] * sessions
+    results = [None] * sessions
+
+    def session(index):
+        question = f"Tell me about roofing sheets (session {index})"
+        writes = []
+        barrier.wait()
+        started = time.perf_counter()
+
+        def write(text):
+            writes.append(time.perf_counter() - started)
+
+        if mode == "per_session":
+            backend = streamlit_app.RAGBackend(markdown_content=streamlit_app.load_markdown_content(path))
+
+            async def consume():
+                text = ""
+                async for chunk in backend.stream_query(question):
+                    if chunk:
+                        text += chunk
+                        write(text)
+                        time.sleep(0.01)
+                return text
+
+            answer = asyncio.run(consume())
+        else:
+            backend = streamlit_app.get_rag_backend(path, os.path.getmtime(path))
+            chunks = streamlit_app.get_background_loop().stream(backend.stream_query(question))
+            answer = streamlit_app.render_stream(chunks, write)
+        session_state[index] = backend
+        results[index] = {"first_redraw": writes[0] if writes else None,
+                          "answer": time.perf_counter() - started,
+                          "redraws": len(writes), "chars": len(answer)}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    rss_after = rss_bytes()
+    completed = [result for result in results if result and result["chars"]]
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "completed": len(completed),
+        "distinct_backends": len({id(backend) for backend in session_state if backend is not None}),
+        "rss_growth_mb": round((rss_after - rss_before) / 2 ** 20, 1) if rss_before and rss_after else None,
+        "first_redraw_seconds": percentiles([r["first_redraw"] for r in completed if r["first_redraw"] is not None]),
+        "answer_seconds": percentiles([r["answer"] for r in completed]),
+        "redraws_per_answer": percentiles([r["redraws"] for r in completed]),
+    }
+
+
+def compare(args):
+    env = {**os.environ, "LLM_PROVIDER": "mock", "MOCK_LLM_TTFT": str(args.ttft),
+           "MOCK_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+           "MOCK_LLM_ANSWER_TOKENS": str(args.answer_tokens)}
+    rows = []
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--sessions", str(args.sessions)],
+            env=env, capture_output=True, text=True, check=True).stdout
+        rows.append(json.loads(output))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--ttft", type=float, default=0.3, help="mock LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.sessions)))
+    else:
+        print(json.dumps(compare(args), indent=2))
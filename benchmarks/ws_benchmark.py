@@ -0,0 +1,145 @@
+"""
+Compare per-turn overhead of the WebSocket transport with the SSE endpoints.
+
+Runs the app in a separate uvicorn process with a fast mock LLM, so the
+time and server CPU per turn are mostly transport overhead. Each session
+asks --turns questions one after another, with --sessions sessions at once:
+
+  sse_two_step  POST /api/messages, then GET /api/messages/{id}/stream
+  sse_single    POST /api/messages/stream
+  websocket     one connection per session at /api/ws
+
+With --fresh-connections the SSE sessions open a new connection for every
+request (no keep-alive), as kiosk browsers behind some proxies do.
+
+    python benchmarks/ws_benchmark.py --sessions 20 --turns 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+from load_benchmark import REPO_DIR, benchmark_env, cpu_seconds, free_port, percentiles, wait_until_ready
+
+TRANSPORTS = ("sse_two_step", "sse_single", "websocket")
+
+
+async def read_sse(response, turn, started):
+    async for line in response.aiter_lines():
+        if line == "data: [DONE]":
+            turn["ok"] = True
+            return
+        if line.startswith("data: ") and turn["ttft"] is None and json.loads(line[6:]).get("content"):
+            turn["ttft"] = time.perf_counter() - started
+
+
+async def sse_session(base_url, transport, turns, fresh, session):
+    results = []
+    limits = httpx.Limits(max_keepalive_connections=0 if fresh else 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        chat_id = None
+        for index in range(turns):
+            turn = {"ok": False, "ttft": None}
+            question = f"Tell me about roofing sheets (session {session}, turn {index})"
+            started = time.perf_counter()
+            if transport == "sse_single":
+                async with client.stream("POST", "/api/messages/stream",
+                                         json={"chat_id": chat_id, "content": question}) as response:
+                    await read_sse(response, turn, started)
+            else:
+                created = (await client.post("/api/messages", json={"chat_id": chat_id, "content": question})).json()
+                chat_id = created["chat_id"]
+                async with client.stream("GET", f"/api/messages/{created['message_id']}/stream",
+                                         params={"chat_id": chat_id}) as response:
+                    await read_sse(response, turn, started)
+            turn["latency"] = time.perf_counter() - started
+            results.append(turn)
+    return results
+
+
+async def ws_session(base_url, turns, session):
+    results = []
+    async with websockets.connect(base_url.replace("http", "ws", 1) + "/api/ws") as socket:
+        chat_id = None
+        for index in range(turns):
+            turn = {"ok": False, "ttft": None}
+            started = time.perf_counter()
+            await socket.send(json.dumps({"type": "message", "chat_id": chat_id,
+                                          "content": f"Tell me about roofing sheets (session {session}, turn {index})"}))
+            while True:
+                message = json.loads(await socket.recv())
+                if message["type"] == "created":
+                    chat_id = message["chat_id"]
+                elif message["type"] == "event":
+                    if turn["ttft"] is None and message["data"].get("content"):
+                        turn["ttft"] = time.perf_counter() - started
+                elif message["type"] in ("done", "error"):
+                    turn["ok"] = message.get("complete", False)
+                    break
+            turn["latency"] = time.perf_counter() - started
+            results.append(turn)
+    return results
+
+
+async def run_transport(base_url, server_pid, transport, args):
+    cpu_before = cpu_seconds(server_pid)
+    started = time.perf_counter()
+    if transport == "websocket":
+        sessions = [ws_session(base_url, args.turns, session) for session in range(args.sessions)]
+    else:
+        sessions = [sse_session(base_url, transport, args.turns, args.fresh_connections, session)
+                    for session in range(args.sessions)]
+    turns = [turn for results in await asyncio.gather(*sessions) for turn in results]
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds(server_pid) - cpu_before
+    ok = [turn for turn in turns if turn["ok"]]
+    return {
+        "transport": transport,
+        "turns": len(turns),
+        "completed": len(ok),
+        "seconds": round(elapsed, 3),
+        "ttft_seconds": percentiles([turn["ttft"] for turn in ok if turn["ttft"] is not None]),
+        "turn_seconds": percentiles([turn["latency"] for turn in ok]),
+        "server_cpu_ms_per_turn": round(cpu * 1000 / len(turns), 3) if turns else None,
+    }
+
+
+async def compare(args):
+    run_args = argparse.Namespace(ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                                  answer_tokens=args.answer_tokens, error_rate=0.0, store=args.store,
+                                  cache=False, coalesce_ms=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = benchmark_env(run_args, os.path.join(tmp, "chats.db"))
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=REPO_DIR, env={**os.environ, **env}, stdout=subprocess.DEVNULL)
+        try:
+            await wait_until_ready(base_url)
+            return [await run_transport(base_url, server.pid, transport, args) for transport in args.transports]
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument("--fresh-connections", action="store_true", help="no HTTP keep-alive for the SSE sessions")
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--ttft", type=float, default=0.01, help="mock LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=2000)
+    parser.add_argument("--answer-tokens", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(compare(args)), indent=2))
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import sys
+
+
+def record_hash(record):
+    """Short content hash of a JSON-serializable record; key order doesn't matter."""
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class CatalogDiff:
+    """Keys of the products added, changed and removed between two versions of the catalog."""
+
+    def __init__(self, added=(), changed=(), removed=()):
+        self.added = list(added)
+        self.changed = list(changed)
+        self.removed = list(removed)
+
+    @classmethod
+    def between(cls, previous, current):
+        """
+        Compare two {key: fingerprint} mappings (content hashes, or anything comparable).
+        Added and changed keys come in `current`'s order.
+        """
+        return cls(
+            added=[key for key in current if key not in previous],
+            changed=[key for key, value in current.items() if key in previous and previous[key] != value],
+            removed=[key for key in previous if key not in current],
+        )
+
+    @property
+    def empty(self):
+        return not (self.added or self.changed or self.removed)
+
+    def summary(self):
+        return {"added": len(self.added), "changed": len(self.changed), "removed": len(self.removed)}
+
+    def __repr__(self):
+        return f"CatalogDiff(+{len(self.added)} ~{len(self.changed)} -{len(self.removed)})"
+
+
+def product_hashes(json_file_path):
+    """{url: hash} for the products in a catalog JSON file such as anton_products.json."""
+    with open(json_file_path, "r", encoding="utf-8") as file:
+        return {product.get("url", ""): record_hash(product) for product in json.load(file)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python catalog_diff.py OLD_PRODUCTS.json NEW_PRODUCTS.json")
+        sys.exit(2)
+    diff = CatalogDiff.between(product_hashes(sys.argv[1]), product_hashes(sys.argv[2]))
+    print(json.dumps({"added": diff.added, "changed": diff.changed, "removed": diff.removed}, indent=2))
@@ -0,0 +1,416 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from catalog_diff import CatalogDiff
+
+# Lowercase alphanumeric runs; keeps product codes like 95185 and sizes like 25mm intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Very common words that only add noise to the lexical scores
+STOP_WORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from",
+    "have", "how", "i", "in", "is", "it", "me", "much", "my", "of", "on", "or",
+    "the", "there", "this", "to", "what", "which", "with", "you", "your",
+}
+
+# Free text sections (company info, policies) are merged into chunks of about this size
+TEXT_CHUNK_CHARS = 2000
+
+
+def tokenize(text):
+    """Split text into lowercase search terms, dropping stop words."""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate (about 4 characters per token).
+    Good enough for prompt budgeting without loading a real tokenizer.
+    """
+    return (len(text) + 3) // 4
+
+
+class ProductChunk:
+    """A retrievable unit of the catalog: all table rows of one product, or a block of free text."""
+
+    def __init__(self, key, title, text, is_table=True):
+        self.key = key
+        self.title = title
+        self.text = text
+        self.is_table = is_table
+        self.tokens = estimate_tokens(text)
+
+    def __repr__(self):
+        return f"ProductChunk(key={self.key!r}, title={self.title!r}, tokens={self.tokens})"
+
+
+def _split_row(line):
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def _is_separator(line):
+    return set(line.replace("|", "").strip()) <= set("-: ") and "-" in line
+
+
+def _text_chunks(lines, start_index):
+    """Merge blank-line separated paragraphs into chunks of roughly TEXT_CHUNK_CHARS."""
+    chunks = []
+    paragraphs = []
+    current = []
+    for line in lines:
+        if line.strip():
+            current.append(line)
+        elif current:
+            paragraphs.append("\n".join(current))
+            current = []
+    if current:
+        paragraphs.append("\n".join(current))
+
+    buffer = []
+    size = 0
+    for paragraph in paragraphs:
+        if buffer and size + len(paragraph) > TEXT_CHUNK_CHARS:
+            chunks.append(buffer)
+            buffer = []
+            size = 0
+        buffer.append(paragraph)
+        size += len(paragraph)
+    if buffer:
+        chunks.append(buffer)
+
+    result = []
+    for offset, block in enumerate(chunks):
+        text = "\n\n".join(block)
+        title = block[0].splitlines()[0].strip("<p> #").strip()[:60]
+        result.append(ProductChunk(f"text-{start_index + offset}", title, text, is_table=False))
+    return result
+
+
+def _split_sections(lines):
+    """Split a compact catalog (see convert_compact_md.py) into one chunk per '## ' product section."""
+    chunks = []
+    preamble = []
+    current = None
+    for line in lines:
+        if line.startswith("## "):
+            current = [line]
+            chunks.append(current)
+        elif current is None:
+            preamble.append(line)
+        else:
+            current.append(line)
+
+    result = []
+    for section in chunks:
+        text = "\n".join(section).strip()
+        # The line after the heading is the product URL
+        key = section[1].strip() if len(section) > 1 and section[1].startswith("http") else f"section-{len(result)}"
+        result.append(ProductChunk(key, section[0][3:].strip(), text, is_table=False))
+    result.extend(_text_chunks(preamble, len(result)))
+    return result
+
+
+def split_markdown_catalog(markdown):
+    """
+    Split a markdown catalog into per-product chunks.
+    Table rows are grouped by their first column (the product URL), so every
+    variant of a product ends up in the same chunk. Anything outside the table
+    is split into free text chunks. Compact catalogs with one '## ' section per
+    product are split by section instead. Returns (table_header, chunks).
+    """
+    lines = markdown.splitlines()
+    if any(line.startswith("## ") for line in lines):
+        return "", _split_sections(lines)
+
+    header = ""
+    title_column = 1
+    chunks = []
+    products = {}
+    text_lines = []
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        is_row = line.lstrip().startswith("|")
+        if is_row and not header and i + 1 < len(lines) and _is_separator(lines[i + 1]):
+            header = line + "\n" + lines[i + 1]
+            columns = [column.lower() for column in _split_row(line)]
+            for name in ("product_name", "main_product", "product name"):
+                if name in columns:
+                    title_column = columns.index(name)
+                    break
+            i += 2
+            continue
+        if is_row and header:
+            cells = _split_row(line)
+            key = cells[0]
+            if key not in products:
+                title = cells[title_column] if title_column < len(cells) else key
+                products[key] = {"title": title or key, "rows": []}
+                chunks.append(key)
+            products[key]["rows"].append(line.strip())
+        else:
+            text_lines.append(line)
+        i += 1
+
+    result = [
+        ProductChunk(key, products[key]["title"], "\n".join(products[key]["rows"]))
+        for key in chunks
+    ]
+    result.extend(_text_chunks(text_lines, len(result)))
+    return header, result
+
+
+def _document_terms(chunk):
+    return tokenize(chunk.title + " " + chunk.text)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of chunks.
+    The inverted index (term -> [(doc, term frequency)]) is built once up front,
+    so a query only touches the postings of its own terms. updated() derives a
+    new index for a few changed chunks without re-tokenizing the rest; removed
+    chunks leave a None in `chunks` so the other doc ids stay valid.
+    """
+
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+
+        for doc_id, chunk in enumerate(self.chunks):
+            terms = _document_terms(chunk)
+            self.doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((doc_id, frequency))
+        self._compute_statistics()
+
+    def _compute_statistics(self):
+        count = sum(1 for chunk in self.chunks if chunk is not None)
+        self.avg_doc_length = (sum(self.doc_lengths) / count) if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def updated(self, replacements, additions=()):
+        """
+        A new index with documents replaced (`replacements` maps doc id to the
+        new chunk, or to None to remove it) and `additions` appended. Only the
+        posting lists of affected terms are rebuilt; the rest are shared with
+        this index, which is left unchanged for readers still using it.
+        """
+        index = BM25Index.__new__(BM25Index)
+        index.k1 = self.k1
+        index.b = self.b
+        index.chunks = list(self.chunks)
+        index.doc_lengths = list(self.doc_lengths)
+        index.postings = defaultdict(list, self.postings)
+        rebuilt = {}
+
+        def posting_list(term):
+            if term not in rebuilt:
+                rebuilt[term] = list(index.postings.get(term, ()))
+            return rebuilt[term]
+
+        changes = list(replacements.items())
+        changes.extend((len(self.chunks) + offset, chunk) for offset, chunk in enumerate(additions))
+        for doc_id, chunk in changes:
+            if doc_id < len(self.chunks) and self.chunks[doc_id] is not None:
+                for term in set(_document_terms(self.chunks[doc_id])):
+                    rebuilt[term] = [entry for entry in posting_list(term) if entry[0] != doc_id]
+            if doc_id == len(index.chunks):
+                index.chunks.append(None)
+                index.doc_lengths.append(0)
+            index.chunks[doc_id] = chunk
+            index.doc_lengths[doc_id] = 0
+            if chunk is not None:
+                terms = _document_terms(chunk)
+                index.doc_lengths[doc_id] = len(terms)
+                for term, frequency in Counter(terms).items():
+                    posting_list(term).append((doc_id, frequency))
+
+        for term, docs in rebuilt.items():
+            if docs:
+                index.postings[term] = docs
+            else:
+                index.postings.pop(term, None)
+        # Document count and average length change, so every idf does; that is one pass over the vocabulary
+        index._compute_statistics()
+        return index
+
+    def scores(self, query):
+        """Return {doc_id: score} for every chunk sharing at least one term with the query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, frequency in docs:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, top_k=5):
+        """Return the top_k (chunk, score) pairs for the query, best first."""
+        scores = self.scores(query)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.chunks[doc_id], score) for doc_id, score in ranked]
+
+
+class ContextSelection:
+    """The catalog context picked for one question, plus debug information about the pick."""
+
+    def __init__(self, text, chunks, scores=None, facets=None):
+        self.text = text
+        self.chunks = chunks
+        self.scores = scores or []
+        self.tokens = estimate_tokens(text)
+        # The facet filter that narrowed the candidates, if any (see product_facets)
+        self.facets = facets
+
+    @property
+    def products(self):
+        return [chunk.title for chunk in self.chunks]
+
+    def debug_info(self):
+        info = {
+            "selected_products": self.products,
+            "scores": [round(score, 3) for score in self.scores],
+            "context_tokens": self.tokens,
+        }
+        if self.facets is not None:
+            info["facets"] = self.facets
+        return info
+
+
+class CatalogIndex:
+    """
+    Retrieval over a markdown catalog.
+    Splits the catalog into per-product chunks and indexes them with BM25 once,
+    then selects the top-k relevant products for a question within a token budget.
+    """
+
+    def __init__(self, markdown):
+        self.markdown = markdown
+        self.header, self.chunks = split_markdown_catalog(markdown)
+        self.index = BM25Index(self.chunks)
+
+    def updated(self, markdown):
+        """
+        Index for a new version of the catalog markdown, re-indexing only the
+        chunks that were added, changed or removed (matched by key, i.e. product
+        URL). Returns (index, CatalogDiff); this index is left unchanged.
+        """
+        header, chunks = split_markdown_catalog(markdown)
+        current = {chunk.key: chunk for chunk in chunks}
+        if len(current) != len(chunks):
+            # Repeated keys can't be matched up; index from scratch
+            return CatalogIndex(markdown), CatalogDiff(added=list(current))
+        doc_ids = {chunk.key: doc_id for doc_id, chunk in enumerate(self.index.chunks) if chunk is not None}
+        diff = CatalogDiff.between(
+            {key: (self.index.chunks[doc_id].title, self.index.chunks[doc_id].text) for key, doc_id in doc_ids.items()},
+            {key: (chunk.title, chunk.text) for key, chunk in current.items()})
+
+        replacements = {doc_ids[key]: current[key] for key in diff.changed}
+        replacements.update((doc_ids[key], None) for key in diff.removed)
+
+        index = CatalogIndex.__new__(CatalogIndex)
+        index.markdown = markdown
+        index.header = header
+        # Unchanged chunks keep their old objects, which the BM25 index refers to
+        changed = set(diff.changed)
+        index.chunks = [self.index.chunks[doc_ids[key]] if key in doc_ids and key not in changed else chunk
+                        for key, chunk in current.items()]
+        index.index = self.index.updated(replacements, [current[key] for key in diff.added])
+        return index, diff
+
+    def search(self, query, top_k=5):
+        return self.index.search(query, top_k)
+
+    def render(self, chunks):
+        """Render chunks as markdown: one table holding all product rows, then any free text."""
+        rows = [chunk.text for chunk in chunks if chunk.is_table]
+        texts = [chunk.text for chunk in chunks if not chunk.is_table]
+        parts = []
+        if rows:
+            parts.append(self.header + "\n" + "\n".join(rows))
+        parts.extend(texts)
+        return "\n\n".join(parts)
+
+    def narrow(self, chunk, product_codes):
+        """`chunk` with only its table rows for the given product codes; unchanged if that would drop every row."""
+        columns = _split_row(self.header.splitlines()[0]) if self.header else []
+        if not chunk.is_table or "product_code" not in columns:
+            return chunk
+        column = columns.index("product_code")
+        lines = chunk.text.splitlines()
+        rows = [line for line in lines if column < len(_split_row(line)) and _split_row(line)[column] in product_codes]
+        if not rows or len(rows) == len(lines):
+            return chunk
+        return ProductChunk(chunk.key, chunk.title, "\n".join(rows))
+
+    def trim(self, chunk, max_tokens):
+        """
+        `chunk` cut down to about max_tokens: its first line (a product's first row, with the
+        description, or a section's heading) and then as many of the following lines as fit,
+        table rows without the description they repeat. None if not even the first line fits.
+        """
+        lines = chunk.text.splitlines()
+        columns = _split_row(self.header.splitlines()[0]) if self.header else []
+        if chunk.is_table and "description" in columns:
+            column = columns.index("description")
+            for i in range(1, len(lines)):
+                cells = _split_row(lines[i])
+                if column < len(cells):
+                    cells[column] = ""
+                    lines[i] = "| " + " | ".join(cells) + " |"
+        kept = []
+        used = 0
+        for line in lines:
+            cost = estimate_tokens(line + "\n")
+            if used + cost > max_tokens:
+                break
+            kept.append(line)
+            used += cost
+        if not kept:
+            return None
+        return ProductChunk(chunk.key, chunk.title, "\n".join(kept), chunk.is_table)
+
+    def select(self, query, top_k=5, max_tokens=None, candidates=None):
+        """
+        Pick up to top_k relevant chunks whose combined size fits in max_tokens
+        (None means no limit; 0 means the prompt has no room left, so nothing is picked).
+        `candidates` can be a list of (chunk, score) pairs from another retriever;
+        by default the BM25 index is searched. A chunk too big for the room left
+        (a product with many variants) is cut down with trim() rather than left out.
+        """
+        if max_tokens is not None and max_tokens <= 0:
+            return ContextSelection("", [])
+        if candidates is None:
+            candidates = self.search(query, top_k)
+        budget = max_tokens
+        # The table header is paid once if any product row is selected
+        header_tokens = estimate_tokens(self.header)
+
+        selected = []
+        scores = []
+        used = 0
+        has_table = False
+        for chunk, score in candidates[:top_k]:
+            header_cost = header_tokens if chunk.is_table and not has_table else 0
+            if budget is not None and used + header_cost + chunk.tokens > budget:
+                chunk = self.trim(chunk, budget - used - header_cost)
+                if chunk is None:
+                    continue
+            cost = header_cost + chunk.tokens
+            selected.append(chunk)
+            scores.append(score)
+            used += cost
+            has_table = has_table or chunk.is_table
+        return ContextSelection(self.render(selected), selected, scores)
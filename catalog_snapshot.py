@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime
+
+from product_facets import FacetIndex
+from product_rag import ProductRAG
+from product_store import ProductStore
+from query_router import QueryRouter
+from vector_index import HybridRetriever, load_or_build_vector_index
+
+# File events are coalesced for this long before a reload starts (editors write in several steps)
+RELOAD_DEBOUNCE_SECONDS = 0.5
+
+
+class CatalogSnapshot:
+    """
+    Immutable, versioned view of the catalog: the raw markdown, the ProductRAG
+    built on it (prompt text and retrieval indexes), the product store and the
+    query router. Requests hold on to the snapshot they started with, so a
+    reload never changes the data under an in-flight answer.
+    """
+
+    def __init__(self, version, product_data, rag, store, router, sources, revision=1, changes=None):
+        self.version = version
+        self.product_data = product_data
+        self.rag = rag
+        self.store = store
+        self.router = router
+        self.sources = sources
+        # Counts the versions this process has loaded; `changes` says what the last one changed
+        self.revision = revision
+        self.changes = changes or {}
+        self.loaded_at = datetime.now().isoformat()
+
+    @classmethod
+    def build(cls, catalog_path, json_path, csv_path, cache=None, single_flight=None, limiter=None,
+              retriever="bm25", hybrid_alpha=0.6, previous=None):
+        """
+        Read the source files and build every derived structure. Blocking; run it off the event loop.
+        With a `previous` snapshot, the catalog index is updated for the products that
+        changed instead of being rebuilt (the vector index always updates incrementally
+        against the copy saved on disk); if no source changed, `previous` is returned.
+        """
+        digest = hashlib.sha256()
+        for path in (catalog_path, json_path, csv_path):
+            with open(path, "rb") as file:
+                digest.update(file.read())
+        version = digest.hexdigest()[:16]
+        if previous is not None and previous.version == version:
+            return previous
+        with open(catalog_path, "r", encoding="utf-8") as file:
+            product_data = file.read()
+
+        store = (ProductStore()
+                 .load_json(json_path)
+                 .load_csv(csv_path)
+                 .load_catalog_markdown(product_data))
+        facets = FacetIndex(store)
+
+        changes = {}
+        catalog_index = None
+        previous_index = previous.rag.catalog_index if previous is not None else None
+        if previous_index is not None and product_data:
+            catalog_index, diff = previous_index.updated(product_data)
+            changes["catalog"] = diff.summary()
+        rag = ProductRAG(markdown_content=product_data, cache=cache, single_flight=single_flight, limiter=limiter,
+                         catalog_index=catalog_index, facets=facets, catalog_version=version)
+        if retriever in ("vector", "hybrid") and rag.catalog_index:
+            vector_index = load_or_build_vector_index(json_path)
+            if vector_index.diff is not None:
+                changes["vectors"] = vector_index.diff.summary()
+            alpha = 1.0 if retriever == "vector" else hybrid_alpha
+            rag.retriever = HybridRetriever(vector_index, rag.catalog_index, alpha=alpha)
+
+        router = QueryRouter(rag, store, facets)
+        return cls(version, product_data, rag, store, router, [catalog_path, json_path, csv_path],
+                   revision=previous.revision + 1 if previous is not None else 1, changes=changes)
+
+    def status(self):
+        return {
+            "version": self.version,
+            "revision": self.revision,
+            "changes": self.changes,
+            "loaded_at": self.loaded_at,
+            "sources": self.sources,
+            "products": len(self.store.products),
+            "variants": len(self.store.by_code),
+            "chunks": len(self.rag.catalog_index.chunks) if self.rag.catalog_index else 0,
+            "facets": {
+                "categories": len(self.rag.facets.categories),
+                "colors": len(self.rag.facets.colors),
+                "rows": len(self.rag.facets.row_price),
+            },
+        }
+
+
+class CatalogManager:
+    """
+    Holds the current CatalogSnapshot and swaps in a new one when the source
+    files change or reload() is called. Snapshots are built in a worker thread
+    and published with a single reference assignment, which is atomic.
+    """
+
+    def __init__(self, catalog_path, json_path, csv_path, **build_options):
+        self.catalog_path = catalog_path
+        self.json_path = json_path
+        self.csv_path = csv_path
+        self.build_options = build_options
+        self.current = self._build()
+        self.reloads = 0
+        self.last_error = None
+        self.observer = None
+        self.loop = None
+        self._reload_lock = asyncio.Lock()
+        self._pending_reload = None
+
+    def _build(self, previous=None):
+        return CatalogSnapshot.build(self.catalog_path, self.json_path, self.csv_path, previous=previous,
+                                     **self.build_options)
+
+    async def reload(self):
+        """
+        Rebuild the snapshot off the event loop and swap it in.
+        Returns True if a new version was published.
+        """
+        async with self._reload_lock:
+            try:
+                # Only the products that changed since the current snapshot are re-indexed
+                snapshot = await asyncio.to_thread(self._build, self.current)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error reloading catalog: {e}")
+                return False
+            self.last_error = None
+            if snapshot.version == self.current.version:
+                return False
+            # Keep the fast path hit-rate counters across versions
+            snapshot.router.stats = self.current.router.stats
+            self.current = snapshot
+            self.reloads += 1
+            print(f"Catalog reloaded: version {snapshot.version} (revision {snapshot.revision}, {snapshot.changes})")
+            return True
+
+    def _schedule_reload(self):
+        """Called from the watchdog thread; debounces bursts of file events into one reload."""
+        def start():
+            if self._pending_reload is not None:
+                self._pending_reload.cancel()
+            self._pending_reload = self.loop.call_later(
+                RELOAD_DEBOUNCE_SECONDS, lambda: asyncio.ensure_future(self.reload()))
+        self.loop.call_soon_threadsafe(start)
+
+    def start_watching(self):
+        """Reload automatically when any source file changes. Must be called from the event loop."""
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self.loop = asyncio.get_running_loop()
+        watched = {os.path.abspath(path) for path in (self.catalog_path, self.json_path, self.csv_path)}
+        manager = self
+
+        class SourceChangeHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = {os.path.abspath(event.src_path), os.path.abspath(getattr(event, "dest_path", "") or "")}
+                if event.event_type in ("modified", "created", "moved") and paths & watched:
+                    manager._schedule_reload()
+
+        self.observer = Observer()
+        for directory in {os.path.dirname(path) for path in watched}:
+            self.observer.schedule(SourceChangeHandler(), directory, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+
+    def stop_watching(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+
+    def status(self):
+        return {
+            **self.current.status(),
+            "reloads": self.reloads,
+            "watching": self.observer is not None,
+            "last_error": self.last_error,
+        }
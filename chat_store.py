@@ -0,0 +1,346 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_CHAT_TITLE = "New Chat"
+
+
+class ChatStore:
+    """
+    Interface for chat and message storage used by the API.
+    Chats are dicts with id, title and created_at; messages are dicts with
+    id, role, content, created_at and status, kept in the order they were added.
+    `status` is None for a normal message, "truncated" for an answer that
+    was cut short because the client went away and "generating" for an answer
+    a worker has claimed (see claim_message) and not yet stored.
+    All methods are async so implementations never block the event loop.
+    """
+
+    async def list_chats(self):
+        raise NotImplementedError
+
+    async def create_chat(self, title=DEFAULT_CHAT_TITLE):
+        raise NotImplementedError
+
+    async def get_chat_info(self, chat_id):
+        """Chat fields plus `message_count`, without loading the messages; None if missing."""
+        raise NotImplementedError
+
+    async def get_chat(self, chat_id):
+        """Chat fields plus its `messages`; None if missing."""
+        raise NotImplementedError
+
+    async def update_chat_title(self, chat_id, title):
+        raise NotImplementedError
+
+    async def delete_chat(self, chat_id):
+        raise NotImplementedError
+
+    async def add_messages(self, chat_id, messages, title=None):
+        """Append messages (and optionally retitle the chat) in one write."""
+        raise NotImplementedError
+
+    async def get_message(self, chat_id, message_id):
+        raise NotImplementedError
+
+    async def get_messages_before(self, chat_id, message_id):
+        """All messages of the chat that precede message_id, oldest first."""
+        raise NotImplementedError
+
+    async def update_message(self, chat_id, message_id, content, status=None):
+        raise NotImplementedError
+
+    async def claim_message(self, chat_id, message_id, owner, lease_seconds):
+        """
+        Mark an unanswered message as being generated by `owner` (status "generating").
+        Succeeds if nobody is generating it, `owner` already is, or the other claim is
+        older than `lease_seconds` (its worker most likely died). Storing the answer
+        with update_message() ends the claim.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def new_chat(title=DEFAULT_CHAT_TITLE):
+    return {"id": str(uuid.uuid4()), "title": title, "created_at": datetime.now().isoformat()}
+
+
+class InMemoryChatStore(ChatStore):
+    """Process-local store; messages are also indexed by id so lookups don't scan the chat."""
+
+    def __init__(self):
+        self.chats = {}
+        self.message_index = {}
+        # message id -> (owner, claimed at) for answers being generated
+        self.claims = {}
+
+    async def list_chats(self):
+        return [{"id": chat["id"], "title": chat["title"], "created_at": chat["created_at"]}
+                for chat in self.chats.values()]
+
+    async def create_chat(self, title=DEFAULT_CHAT_TITLE):
+        chat = new_chat(title)
+        self.chats[chat["id"]] = {**chat, "messages": []}
+        return chat
+
+    async def get_chat_info(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            return None
+        return {"id": chat["id"], "title": chat["title"], "created_at": chat["created_at"],
+                "message_count": len(chat["messages"])}
+
+    async def get_chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            return None
+        return {**chat, "messages": [dict(message) for message in chat["messages"]]}
+
+    async def update_chat_title(self, chat_id, title):
+        if chat_id not in self.chats:
+            return False
+        self.chats[chat_id]["title"] = title
+        return True
+
+    async def delete_chat(self, chat_id):
+        chat = self.chats.pop(chat_id, None)
+        if chat is None:
+            return False
+        for message in chat["messages"]:
+            self.message_index.pop(message["id"], None)
+        return True
+
+    async def add_messages(self, chat_id, messages, title=None):
+        chat = self.chats[chat_id]
+        for message in messages:
+            self.message_index[message["id"]] = (chat_id, len(chat["messages"]))
+            chat["messages"].append({"status": None, **message})
+        if title is not None:
+            chat["title"] = title
+
+    async def get_message(self, chat_id, message_id):
+        location = self.message_index.get(message_id)
+        if location is None or location[0] != chat_id:
+            return None
+        return dict(self.chats[chat_id]["messages"][location[1]])
+
+    async def get_messages_before(self, chat_id, message_id):
+        location = self.message_index.get(message_id)
+        if location is None or location[0] != chat_id:
+            return []
+        return [dict(message) for message in self.chats[chat_id]["messages"][:location[1]]]
+
+    async def update_message(self, chat_id, message_id, content, status=None):
+        location = self.message_index.get(message_id)
+        if location is None or location[0] != chat_id:
+            return False
+        message = self.chats[chat_id]["messages"][location[1]]
+        message["content"] = content
+        message["status"] = status
+        self.claims.pop(message_id, None)
+        return True
+
+    async def claim_message(self, chat_id, message_id, owner, lease_seconds):
+        location = self.message_index.get(message_id)
+        if location is None or location[0] != chat_id:
+            return False
+        message = self.chats[chat_id]["messages"][location[1]]
+        claim = self.claims.get(message_id)
+        if message["content"] or (message["status"] == "generating" and claim is not None
+                                  and claim[0] != owner and claim[1] >= time.time() - lease_seconds):
+            return False
+        message["status"] = "generating"
+        self.claims[message_id] = (owner, time.time())
+        return True
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT,
+    owner TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS messages_chat_seq ON messages (chat_id, seq);
+"""
+
+
+class SQLiteChatStore(ChatStore):
+    """
+    Durable store in an SQLite database in WAL mode, so reads never wait for
+    the writer. Queries run in worker threads (one connection per thread) and
+    use the primary keys and the (chat_id, seq) index instead of scans.
+    The database file can be shared by several uvicorn worker processes.
+    """
+
+    def __init__(self, path="chats.db"):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+            # Databases created before messages had a status (or a claim) get the columns added
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(messages)")}
+            for column, column_type in (("status", "TEXT"), ("owner", "TEXT"), ("claimed_at", "REAL")):
+                if column not in columns:
+                    try:
+                        connection.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+                    except sqlite3.OperationalError:
+                        pass  # another worker added it first
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    async def _run(self, function, *args):
+        return await asyncio.to_thread(function, *args)
+
+    def _list_chats(self):
+        rows = self._connection().execute("SELECT id, title, created_at FROM chats ORDER BY created_at").fetchall()
+        return [dict(row) for row in rows]
+
+    async def list_chats(self):
+        return await self._run(self._list_chats)
+
+    def _create_chat(self, chat):
+        with self._connection() as connection:
+            connection.execute("INSERT INTO chats (id, title, created_at) VALUES (?, ?, ?)",
+                               (chat["id"], chat["title"], chat["created_at"]))
+        return chat
+
+    async def create_chat(self, title=DEFAULT_CHAT_TITLE):
+        return await self._run(self._create_chat, new_chat(title))
+
+    def _get_chat_info(self, chat_id):
+        row = self._connection().execute(
+            "SELECT id, title, created_at, "
+            "(SELECT COUNT(*) FROM messages WHERE chat_id = chats.id) AS message_count "
+            "FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return dict(row) if row else None
+
+    async def get_chat_info(self, chat_id):
+        return await self._run(self._get_chat_info, chat_id)
+
+    def _get_chat(self, chat_id):
+        connection = self._connection()
+        row = connection.execute("SELECT id, title, created_at FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        messages = connection.execute(
+            "SELECT id, role, content, created_at, status FROM messages WHERE chat_id = ? ORDER BY seq",
+            (chat_id,)).fetchall()
+        return {**dict(row), "messages": [dict(message) for message in messages]}
+
+    async def get_chat(self, chat_id):
+        return await self._run(self._get_chat, chat_id)
+
+    def _update_chat_title(self, chat_id, title):
+        with self._connection() as connection:
+            return connection.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id)).rowcount > 0
+
+    async def update_chat_title(self, chat_id, title):
+        return await self._run(self._update_chat_title, chat_id, title)
+
+    def _delete_chat(self, chat_id):
+        with self._connection() as connection:
+            return connection.execute("DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount > 0
+
+    async def delete_chat(self, chat_id):
+        return await self._run(self._delete_chat, chat_id)
+
+    def _add_messages(self, chat_id, messages, title):
+        with self._connection() as connection:
+            # Take the write lock before reading MAX(seq), so concurrent writers (other workers) can't reuse it
+            connection.execute("BEGIN IMMEDIATE")
+            start = connection.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE chat_id = ?",
+                                       (chat_id,)).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO messages (id, chat_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(message["id"], chat_id, start + offset, message["role"], message["content"], message["created_at"])
+                 for offset, message in enumerate(messages)])
+            if title is not None:
+                connection.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
+
+    async def add_messages(self, chat_id, messages, title=None):
+        await self._run(self._add_messages, chat_id, messages, title)
+
+    def _get_message(self, chat_id, message_id):
+        row = self._connection().execute(
+            "SELECT id, role, content, created_at, status FROM messages WHERE id = ? AND chat_id = ?",
+            (message_id, chat_id)).fetchone()
+        return dict(row) if row else None
+
+    async def get_message(self, chat_id, message_id):
+        return await self._run(self._get_message, chat_id, message_id)
+
+    def _get_messages_before(self, chat_id, message_id):
+        rows = self._connection().execute(
+            "SELECT id, role, content, created_at, status FROM messages "
+            "WHERE chat_id = ? AND seq < (SELECT seq FROM messages WHERE id = ? AND chat_id = ?) ORDER BY seq",
+            (chat_id, message_id, chat_id)).fetchall()
+        return [dict(row) for row in rows]
+
+    async def get_messages_before(self, chat_id, message_id):
+        return await self._run(self._get_messages_before, chat_id, message_id)
+
+    def _update_message(self, chat_id, message_id, content, status):
+        with self._connection() as connection:
+            return connection.execute("UPDATE messages SET content = ?, status = ? WHERE id = ? AND chat_id = ?",
+                                      (content, status, message_id, chat_id)).rowcount > 0
+
+    async def update_message(self, chat_id, message_id, content, status=None):
+        return await self._run(self._update_message, chat_id, message_id, content, status)
+
+    def _claim_message(self, chat_id, message_id, owner, lease_seconds):
+        now = time.time()
+        with self._connection() as connection:
+            # One conditional UPDATE, so two workers can't both claim the message
+            return connection.execute(
+                "UPDATE messages SET status = 'generating', owner = ?, claimed_at = ? "
+                "WHERE id = ? AND chat_id = ? AND content = '' "
+                "AND (status IS NULL OR status != 'generating' OR owner = ? OR claimed_at < ?)",
+                (owner, now, message_id, chat_id, owner, now - lease_seconds)).rowcount > 0
+
+    async def claim_message(self, chat_id, message_id, owner, lease_seconds):
+        return await self._run(self._claim_message, chat_id, message_id, owner, lease_seconds)
+
+    async def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+
+def create_chat_store(kind="sqlite", path="chats.db"):
+    """
+    Build the configured store: "sqlite" (durable, default) or "memory".
+    The memory store is per process, so only use it with a single worker.
+    """
+    if kind == "memory":
+        return InMemoryChatStore()
+    return SQLiteChatStore(path)
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import deque
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; `retry_after` is a suggested wait in seconds."""
+
+    def __init__(self, retry_after, reason="overloaded"):
+        super().__init__(f"Upstream {reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionLimiter:
+    """
+    Caps concurrent upstream LLM calls.
+    Callers beyond the limit wait in a bounded FIFO queue for at most
+    `queue_timeout` seconds; when the queue is full they are rejected at once
+    with Overloaded, so the API can answer 429 instead of piling up requests.
+
+    With `adaptive=True` the limit follows observed upstream behaviour (AIMD):
+    it grows by about one per `limit` successful calls and is cut by
+    `backoff_ratio` when a call errors or is slower than `target_latency`.
+    """
+
+    def __init__(self, max_concurrent=16, max_queue=64, queue_timeout=10.0, adaptive=False,
+                 min_concurrent=1, max_concurrent_limit=None, target_latency=10.0, backoff_ratio=0.8):
+        self.limit = float(max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.min_concurrent = min_concurrent
+        self.max_concurrent_limit = max_concurrent_limit or max_concurrent * 4
+        self.target_latency = target_latency
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.errors = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.service_seconds_avg = 1.0
+
+    def _has_capacity(self):
+        return self.in_flight < int(self.limit)
+
+    def retry_after(self):
+        """Rough time until a queued request would be served, in whole seconds (at least 1)."""
+        backlog = len(self.waiters) + 1
+        return max(1, int(round(backlog * self.service_seconds_avg / max(int(self.limit), 1))))
+
+    def _record_wait(self, started):
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    async def acquire(self):
+        started = time.monotonic()
+        if self._has_capacity() and not self.waiters:
+            self.in_flight += 1
+            self._record_wait(started)
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after(), "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(self.retry_after(), "queue timeout")
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+        self._record_wait(started)
+
+    def release(self, latency=None, error=False):
+        self.in_flight -= 1
+        if error:
+            self.errors += 1
+        if latency is not None and not error:
+            self.service_seconds_avg = 0.9 * self.service_seconds_avg + 0.1 * latency
+        if self.adaptive and latency is not None:
+            if error or latency > self.target_latency:
+                self.limit = max(self.min_concurrent, self.limit * self.backoff_ratio)
+            else:
+                self.limit = min(self.max_concurrent_limit, self.limit + 1.0 / self.limit)
+        # Hand freed slots to waiters in arrival order
+        while self.waiters and self._has_capacity():
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def metrics(self):
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "errors": self.errors,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
@@ -0,0 +1,116 @@
+from catalog_index import estimate_tokens
+
+# Older user questions are kept in the summary up to this many characters each
+SUMMARY_QUESTION_CHARS = 80
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, keeping the start and marking the cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * 4 - 3)].rstrip() + "..."
+
+
+def summarize_turns(messages):
+    """
+    Cheap local summary of older turns: the questions the user asked, in order.
+    Answers are left out; the catalog context is re-selected for every question anyway.
+    """
+    questions = [truncate_to_tokens(" ".join(message["content"].split()), SUMMARY_QUESTION_CHARS // 4)
+                 for message in messages if message["role"] == "user"]
+    if not questions:
+        return ""
+    return "Earlier in this conversation the user asked about: " + "; ".join(questions)
+
+
+def fit_history(history, max_tokens):
+    """
+    Keep as much recent history as fits in max_tokens.
+    The newest turns are kept verbatim (the newest one truncated if it alone is
+    too long); turns that don't fit are folded into a one-line summary.
+    Returns (messages, summary, tokens_used, summarized_count).
+    """
+    kept = []
+    used = 0
+    index = len(history)
+    while index > 0 and max_tokens > 0:
+        message = history[index - 1]
+        cost = message_tokens(message)
+        if used + cost > max_tokens:
+            if kept:
+                break
+            # Even the latest turn alone is too long: keep a truncated copy of it
+            remaining = max_tokens - MESSAGE_OVERHEAD_TOKENS
+            if remaining <= 0:
+                break
+            message = {"role": message["role"], "content": truncate_to_tokens(message["content"], remaining)}
+            cost = message_tokens(message)
+        kept.append({"role": message["role"], "content": message["content"]})
+        used += cost
+        index -= 1
+    kept.reverse()
+
+    older = history[:index]
+    summary = summarize_turns(older)
+    summary_cost = estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+    if summary and used + summary_cost > max_tokens:
+        summary = truncate_to_tokens(summary, max_tokens - used - MESSAGE_OVERHEAD_TOKENS) \
+            if max_tokens - used > MESSAGE_OVERHEAD_TOKENS * 2 else ""
+        summary_cost = estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+    return kept, summary, used + summary_cost, len(older)
+
+
+def retrieval_query(question, history):
+    """
+    Text used to select catalog context. Follow-ups like "and in blue?" name no
+    product, so the previous user question is searched along with the new one.
+    """
+    for message in reversed(history or []):
+        if message["role"] == "user":
+            return f"{message['content']} {question}"
+    return question
+
+
+class PromptBudget:
+    """How one request's prompt tokens were split between instructions, catalog context and history."""
+
+    def __init__(self, total, instructions, question, history_limit):
+        self.total = total
+        self.instructions = instructions
+        self.question = question
+        self.history_limit = history_limit
+        self.history_used = 0
+        self.history_turns = 0
+        self.summarized_turns = 0
+        self.catalog_limit = 0
+        self.catalog_used = 0
+
+    @property
+    def available(self):
+        return max(0, self.total - self.instructions - self.question)
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "instructions": self.instructions,
+            "question": self.question,
+            "history_limit": self.history_limit,
+            "history_used": self.history_used,
+            "history_turns": self.history_turns,
+            "summarized_turns": self.summarized_turns,
+            "catalog_limit": self.catalog_limit,
+            "catalog_used": self.catalog_used,
+        }
+
+    def __str__(self):
+        return (f"total {self.total}, instructions {self.instructions}, question {self.question}, "
+                f"catalog {self.catalog_used}/{self.catalog_limit}, "
+                f"history {self.history_used}/{self.history_limit} "
+                f"({self.history_turns} messages kept, {self.summarized_turns} summarized)")
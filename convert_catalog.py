@@ -0,0 +1,326 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import convert_compact_md
+import convert_csv_to_md
+import convert_json_to_md
+from catalog_diff import record_hash
+
+# Written next to each output file: product hashes, counts and timing for the last run
+MANIFEST_SUFFIX = ".manifest.json"
+# Bump when a renderer's output changes, so re-runs don't reuse products rendered the old way
+FORMAT_VERSION = 1
+READ_CHUNK = 64 * 1024
+# Read once at import: os.umask can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+# --- Read stages: yield source records one at a time ---
+
+def read_csv_rows(path):
+    """The CSV rows after the header."""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        yield from reader
+
+
+def read_csv_header(path):
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return next(csv.reader(file), [])
+
+
+def group_csv_rows(rows):
+    """(url, rows) per product: consecutive rows sharing a URL are one product's variants."""
+    url, group = None, []
+    for row in rows:
+        if group and row[:1] != [url]:
+            yield url, group
+            group = []
+        url = row[0] if row else ""
+        group.append(row)
+    if group:
+        yield url, group
+
+
+def read_json_array(path, chunk_size=READ_CHUNK):
+    """
+    The objects of a top-level JSON array, decoded one at a time while the file
+    is read in chunks, so the whole catalog is never held in memory at once.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer, pos, opened = "", 0, False
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (opened and buffer[pos] == ",")):
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = file.read(chunk_size), 0
+                if not buffer:
+                    raise ValueError(f"{path}: unexpected end of JSON array")
+                continue
+            if not opened:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{path}: expected a JSON array")
+                opened = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The object continues past the buffer
+                more = file.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+
+def key_json_products(products):
+    """(url, product) per JSON product."""
+    for product in products:
+        yield product.get("url", ""), product
+
+
+# --- Hash stage ---
+
+def hash_products(keyed):
+    """(key, hash, record) per product; repeated keys get a #n suffix so every key is unique."""
+    seen = {}
+    for key, record in keyed:
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        yield (f"{key}#{count}" if count else key), record_hash(record), record
+
+
+class OutputFormat:
+    """
+    How one markdown output is produced: where its products come from (`read`
+    yields (key, record)), how one product renders, and the text around and
+    between products.
+    """
+
+    def __init__(self, name, source, output, read, render, header, separator="", footer=""):
+        self.name = name
+        self.source = source
+        self.output = output
+        self.read = read
+        self.render = render
+        self.header = header
+        self.separator = separator
+        self.footer = footer
+
+
+FORMATS = {
+    "csv": OutputFormat(
+        "csv", "anton_products.csv", "anton_csv_products.md",
+        read=lambda path: group_csv_rows(read_csv_rows(path)),
+        render=convert_csv_to_md.render_rows,
+        header=lambda path: convert_csv_to_md.render_header(read_csv_header(path))),
+    "json": OutputFormat(
+        "json", "anton_products.json", "anton_json_products.md",
+        read=lambda path: key_json_products(read_json_array(path)),
+        render=convert_json_to_md.render_variant_rows,
+        header=lambda path: convert_json_to_md.render_header()),
+    "compact": OutputFormat(
+        "compact", "anton_products.json", "anton_compact_products.md",
+        read=lambda path: key_json_products(read_json_array(path)),
+        render=convert_compact_md.render_product,
+        header=lambda path: "", separator="\n\n", footer="\n"),
+}
+
+
+# --- Manifest ---
+
+def manifest_path_for(output):
+    return output + MANIFEST_SUFFIX
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(READ_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(path):
+    """The manifest at `path`, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def usable_manifest(manifest, output_format, output):
+    """Whether products can be copied from `output` using `manifest`'s offsets."""
+    return (manifest is not None
+            and manifest.get("format") == output_format.name
+            and manifest.get("format_version") == FORMAT_VERSION
+            and os.path.exists(output)
+            and manifest.get("output_sha256") == file_sha256(output))
+
+
+def replace_file(tmp_path, path):
+    """
+    Move a temporary file over `path`. mkstemp creates files readable by their owner only;
+    the new file gets the mode of the one it replaces, or the umask's default for new files.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+
+def write_atomically(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        replace_file(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# --- Pipeline ---
+
+def convert(format_name, source=None, output=None, manifest_path=None, force=False):
+    """
+    Convert one catalog source to markdown and write its manifest.
+    Products stream from the read stage through hashing to the output, which is
+    written to a temporary file and moved into place. A product whose hash matches
+    the previous manifest is copied from the previous output instead of rendered;
+    if the result is byte-identical the output file is left untouched, so file
+    watchers don't reload. Returns the manifest.
+    """
+    output_format = FORMATS[format_name]
+    source = source or output_format.source
+    output = output or output_format.output
+    manifest_path = manifest_path or manifest_path_for(output)
+    started = time.perf_counter()
+
+    previous = None if force else read_manifest(manifest_path)
+    if previous is not None and not usable_manifest(previous, output_format, output):
+        previous = None
+    previous_products = previous["products"] if previous else {}
+    source_sha256 = file_sha256(source)
+
+    products = {}
+    counts = {"rendered": 0, "reused": 0, "added": 0, "changed": 0}
+    render_seconds = 0.0
+    digest = hashlib.sha256()
+    offset = 0
+
+    directory = os.path.dirname(os.path.abspath(output))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    old_output = open(output, "rb") if previous else None
+    try:
+        with os.fdopen(fd, "wb") as file:
+            def write(data):
+                nonlocal offset
+                file.write(data)
+                digest.update(data)
+                offset += len(data)
+
+            write(output_format.header(source).encode("utf-8"))
+            separator = output_format.separator.encode("utf-8")
+            for index, (key, product_hash, record) in enumerate(
+                    hash_products(output_format.read(source))):
+                if index and separator:
+                    write(separator)
+                known = previous_products.get(key)
+                if known is not None and known["hash"] == product_hash:
+                    old_output.seek(known["offset"])
+                    block = old_output.read(known["length"])
+                    counts["reused"] += 1
+                else:
+                    render_started = time.perf_counter()
+                    block = output_format.render(record).encode("utf-8")
+                    render_seconds += time.perf_counter() - render_started
+                    counts["rendered"] += 1
+                    counts["changed" if known is not None else "added"] += 1
+                products[key] = {"hash": product_hash, "offset": offset, "length": len(block)}
+                write(block)
+            write(output_format.footer.encode("utf-8"))
+
+        output_sha256 = digest.hexdigest()
+        output_changed = previous is None or previous.get("output_sha256") != output_sha256
+        if output_changed:
+            replace_file(tmp_path, output)
+        else:
+            os.remove(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if old_output is not None:
+            old_output.close()
+
+    manifest = {
+        "format": output_format.name,
+        "format_version": FORMAT_VERSION,
+        "source": source,
+        "source_sha256": source_sha256,
+        "output": output,
+        "output_sha256": output_sha256,
+        "output_bytes": offset,
+        "output_changed": output_changed,
+        "product_count": len(products),
+        **counts,
+        "removed": sum(1 for key in previous_products if key not in products),
+        "seconds": {"total": round(time.perf_counter() - started, 4), "render": round(render_seconds, 4)},
+        "generated_at": datetime.now().isoformat(),
+        "products": products,
+    }
+    write_atomically(manifest_path, json.dumps(manifest, indent=1).encode("utf-8"))
+    return manifest
+
+
+def summary(manifest):
+    return (f"{manifest['format']:<8} {manifest['output']}: {manifest['product_count']} products, "
+            f"{manifest['rendered']} rendered ({manifest['added']} added, {manifest['changed']} changed), "
+            f"{manifest['reused']} reused, {manifest['removed']} removed, "
+            f"{'written' if manifest['output_changed'] else 'unchanged'} in {manifest['seconds']['total']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert the product catalog sources to markdown, skipping unchanged products.")
+    parser.add_argument("formats", nargs="*", default=sorted(FORMATS),
+                        help=f"outputs to build: {', '.join(sorted(FORMATS))} (default: all)")
+    parser.add_argument("--source", help="source file (only with a single format)")
+    parser.add_argument("--output", help="output file (only with a single format)")
+    parser.add_argument("--manifest", help=f"manifest file (default: output + {MANIFEST_SUFFIX})")
+    parser.add_argument("--force", action="store_true", help="render every product, ignoring the previous manifest")
+    args = parser.parse_args()
+    unknown = [name for name in args.formats if name not in FORMATS]
+    if unknown:
+        parser.error(f"unknown format: {', '.join(unknown)}")
+    if len(args.formats) > 1 and (args.source or args.output or args.manifest):
+        parser.error("--source, --output and --manifest need a single format")
+
+    try:
+        for format_name in args.formats:
+            print(summary(convert(format_name, args.source, args.output, args.manifest, args.force)))
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,94 @@
+import os
+import sys
+
+from catalog_index import estimate_tokens
+
+# Variant columns in output order: (header, key in the JSON variant)
+VARIANT_COLUMNS = [
+    ("code", "product_code"),
+    ("size", "size"),
+    ("unit", "unit"),
+    ("color", "color"),
+    ("type", "variant_type"),
+    ("outer", "outer_layer_color"),
+    ("price", "price"),
+]
+
+# Files compared by the token report, as produced by the other convert scripts
+REPORT_FILES = ["product_catalog.md", "anton_csv_products.md", "anton_json_products.md"]
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    # Pipes and newlines would break the table
+    return str(value).replace("|", "/").replace("\n", " ").strip()
+
+
+def render_product(product):
+    """
+    Render one product as a compact markdown section: name, URL and description
+    once, then a dense variant table with empty columns dropped.
+    """
+    product_data = product.get("product_data", {})
+    lines = [f"## {product_data.get('main_product', '')}", product.get("url", "")]
+
+    price = product_data.get("main_product_price")
+    if price is not None:
+        lines.append(f"price: Rs.{_cell(price)}")
+    description = (product_data.get("product_description") or "").strip()
+    if description:
+        lines.append(description)
+
+    variants = [variant for variant in product_data.get("product_variants", []) if isinstance(variant, dict)]
+    rows = [[_cell(variant.get(key)) for _, key in VARIANT_COLUMNS] for variant in variants]
+    keep = [i for i in range(len(VARIANT_COLUMNS)) if any(row[i] for row in rows)]
+    if rows and keep:
+        lines.append("|" + "|".join(VARIANT_COLUMNS[i][0] for i in keep) + "|")
+        lines.append("|" + "|".join("-" for _ in keep) + "|")
+        lines.extend("|" + "|".join(row[i] for i in keep) + "|" for row in rows)
+    return "\n".join(lines)
+
+
+def json_to_compact_markdown(json_data):
+    """Render the whole catalog, one section per parent product."""
+    return "\n\n".join(render_product(product) for product in json_data) + "\n"
+
+
+def token_report(paths):
+    """Return [(path, bytes, estimated tokens)] for the given markdown files that exist."""
+    report = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as file:
+            content = file.read()
+        report.append((path, len(content.encode("utf-8")), estimate_tokens(content)))
+    return report
+
+
+def print_token_report(report, baseline_path):
+    baseline = dict((path, tokens) for path, _, tokens in report).get(baseline_path)
+    print(f"{'file':<28} {'bytes':>10} {'~tokens':>10} {'vs compact':>11}")
+    for path, size, tokens in report:
+        ratio = f"{tokens / baseline:.1f}x" if baseline else "-"
+        print(f"{path:<28} {size:>10,} {tokens:>10,} {ratio:>11}")
+
+
+if __name__ == "__main__":
+    json_file = sys.argv[1] if len(sys.argv) > 1 else 'anton_products.json'
+    md_file = sys.argv[2] if len(sys.argv) > 2 else 'anton_compact_products.md'
+
+    # Streams products into the output and skips unchanged ones on re-runs (see convert_catalog.py)
+    from convert_catalog import convert
+
+    try:
+        convert("compact", json_file, md_file)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+    print(f"Successfully converted {json_file} to {md_file}\n")
+    print_token_report(token_report(REPORT_FILES + [md_file]), md_file)
@@ -1,24 +1,22 @@
-import csv
 import sys
 
+
+def render_header(headers):
+    """Markdown table header for the CSV columns."""
+    return '| ' + ' | '.join(headers) + ' |\n' + '|' + '|'.join(['---' for _ in headers]) + '|\n'
+
+
+def render_rows(rows):
+    """Markdown table rows for one product's CSV rows."""
+    return ''.join('| ' + ' | '.join(row) + ' |\n' for row in rows)
+
+
 def csv_to_markdown(csv_file, md_file):
+    # Streams rows into the output and skips unchanged products on re-runs (see convert_catalog.py)
+    from convert_catalog import convert
+
     try:
-        with open(csv_file, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            headers = next(csv_reader)  # Get the header row
-            
-            # Create markdown table header
-            markdown_content = '| ' + ' | '.join(headers) + ' |\n'
-            markdown_content += '|' + '|'.join(['---' for _ in headers]) + '|\n'
-            
-            # Add table rows
-            for row in csv_reader:
-                markdown_content += '| ' + ' | '.join(row) + ' |\n'
-                
-        # Write to markdown file
-        with open(md_file, 'w', encoding='utf-8') as file:
-            file.write(markdown_content)
-            
+        convert("csv", csv_file, md_file)
         print(f"Successfully converted {csv_file} to {md_file}")
         
     except Exception as e:
@@ -29,4 +27,4 @@ if __name__ == "__main__":
         
     csv_file = 'anton_products.csv'
     md_file = 'anton_csv_products.md'
-    csv_to_markdown(csv_file, md_file)
\ No newline at end of file
+    csv_to_markdown(csv_file, md_file)
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator
+
+from sse import HEARTBEAT, HEARTBEAT_SECONDS
+
+# Events kept per message for resuming; older ones are dropped (a resume past them gets a reset event)
+BUFFER_EVENTS = int(os.getenv("RESUME_BUFFER_EVENTS", "1024"))
+# How long an answer keeps generating with nobody connected, waiting for the client to come back
+GRACE_SECONDS = float(os.getenv("RESUME_GRACE_SECONDS", "15"))
+# How long a finished answer's events stay available for late reconnects
+KEEP_SECONDS = float(os.getenv("RESUME_KEEP_SECONDS", "60"))
+
+DONE = "[DONE]"
+
+
+def parse_event_id(value):
+    """Last-Event-ID as an int, or None if missing or malformed."""
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+class Generation:
+    """
+    One answer being generated in the background, independent of any HTTP request.
+    Events (SSE data payloads) are numbered from 1 and kept in a ring buffer, so
+    clients can follow along, drop off, and resume from the last event they saw.
+    The full answer text is kept in `parts` for clients that fall behind the buffer.
+    A replay of a stored answer numbers its events afresh, so it is always sent
+    from the start (its first event resets the client's text).
+    """
+
+    def __init__(self, message_id, chat_id, buffer_events=BUFFER_EVENTS, grace_seconds=GRACE_SECONDS,
+                 replay=False):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.replay = replay
+        # (event id, payload, length of the answer text before this event)
+        self.events = deque(maxlen=buffer_events)
+        self.parts = []
+        self.text_length = 0
+        self.last_id = 0
+        self.done = False
+        self.grace_seconds = grace_seconds
+        self.subscribers = 0
+        self.abandon_timer = None
+        self.task = None
+        self.changed = asyncio.Event()
+
+    def start(self, produce):
+        """Run `produce(self)` as the background task that publishes this answer's events."""
+        self.task = asyncio.create_task(produce(self))
+        self.task.add_done_callback(self._finished)
+        return self
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def _finished(self, _task):
+        self.done = True
+        if self.abandon_timer is not None:
+            self.abandon_timer.cancel()
+            self.abandon_timer = None
+        self._wake()
+
+    def publish(self, payload, text=None):
+        """Append one event; `text` is the answer text it carries, if any."""
+        self.last_id += 1
+        self.events.append((self.last_id, payload, self.text_length))
+        if text:
+            self.parts.append(text)
+            self.text_length += len(text)
+        self._wake()
+
+    def _events_after(self, last_seen):
+        """Buffered events newer than `last_seen`, with a reset event first if some were already dropped."""
+        if last_seen >= self.last_id:
+            return []
+        first_id, _, text_before = self.events[0]
+        if last_seen >= first_id - 1:
+            return [(event_id, payload) for event_id, payload, _ in self.events if event_id > last_seen]
+        # The client is behind the buffer: resend the answer text up to the buffer, then continue
+        reset = json.dumps({"content": "".join(self.parts)[:text_before], "reset": True})
+        return [(first_id - 1, reset), *((event_id, payload) for event_id, payload, _ in self.events)]
+
+    async def follow(self, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """
+        (event id, payload) pairs from after `last_event_id` (or the start), then live
+        until the answer is done; None whenever nothing was sent for `heartbeat` seconds.
+        Events are read from the buffer as the consumer asks for them, so a slow
+        consumer holds back nothing but its own position in the buffer.
+        """
+        self.subscribers += 1
+        if self.abandon_timer is not None:
+            self.abandon_timer.cancel()
+            self.abandon_timer = None
+        last_seen = 0 if self.replay else last_event_id or 0
+        try:
+            while True:
+                changed = self.changed
+                pending = self._events_after(last_seen)
+                for event in pending:
+                    yield event
+                    last_seen = event[0]
+                if self.done and last_seen >= self.last_id:
+                    return
+                if not pending:
+                    try:
+                        await asyncio.wait_for(changed.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Keep generating for a while in case the client reconnects, then give up
+                self.abandon_timer = asyncio.get_running_loop().call_later(self.grace_seconds, self._abandon)
+
+    async def subscribe(self, last_event_id=None, heartbeat=HEARTBEAT_SECONDS) -> AsyncGenerator[str, None]:
+        """SSE frames for follow(), with a heartbeat comment while idle."""
+        async with aclosing(self.follow(last_event_id, heartbeat)) as events:
+            async for event in events:
+                yield HEARTBEAT if event is None else f"id: {event[0]}\ndata: {event[1]}\n\n"
+
+    @property
+    def complete(self):
+        """Whether the answer finished (its last event is DONE)."""
+        return self.done and bool(self.events) and self.events[-1][1] == DONE
+
+    def cancel(self):
+        """Stop generating now, whether or not anyone is subscribed."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def _abandon(self):
+        self.abandon_timer = None
+        if self.subscribers == 0 and not self.task.done():
+            self.task.cancel()
+
+
+class GenerationRegistry:
+    """Generations by message id, kept until `keep_seconds` after they finish."""
+
+    def __init__(self, keep_seconds=KEEP_SECONDS, grace_seconds=GRACE_SECONDS, buffer_events=BUFFER_EVENTS):
+        self.keep_seconds = keep_seconds
+        self.grace_seconds = grace_seconds
+        self.buffer_events = buffer_events
+        self.generations = {}
+        self.started = 0
+        self.resumed = 0
+
+    def get(self, message_id, chat_id):
+        generation = self.generations.get(message_id)
+        if generation is None or generation.chat_id != chat_id:
+            return None
+        return generation
+
+    def start(self, message_id, chat_id, produce, replay=False):
+        generation = Generation(message_id, chat_id, self.buffer_events, self.grace_seconds, replay)
+        self.generations[message_id] = generation
+        self.started += 1
+        generation.start(produce)
+
+        def schedule_eviction(_task):
+            asyncio.get_running_loop().call_later(self.keep_seconds, self._evict, message_id, generation)
+        generation.task.add_done_callback(schedule_eviction)
+        return generation
+
+    def _evict(self, message_id, generation):
+        if self.generations.get(message_id) is generation:
+            del self.generations[message_id]
+
+    async def cancel_all(self):
+        tasks = [generation.task for generation in self.generations.values() if not generation.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "active": sum(1 for generation in self.generations.values() if not generation.done),
+            "buffered": len(self.generations),
+            "subscribers": sum(generation.subscribers for generation in self.generations.values()),
+            "started": self.started,
+            "resumed": self.resumed,
+        }
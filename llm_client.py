@@ -0,0 +1,243 @@
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from typing import AsyncGenerator
+
+import openai
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Errors worth retrying on the same model: timeouts, dropped connections, rate limits and 5xx
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# How many attempts are kept for stats and for the TTFT percentile used by hedging
+RECENT_ATTEMPTS = 500
+
+
+class LLMUnavailable(Exception):
+    """Every model failed, including retries, before producing any text."""
+
+
+class OpenedStream:
+    """An upstream call that has produced its first piece of text (or finished empty)."""
+
+    def __init__(self, texts, first, started, ttft, record):
+        self.texts = texts
+        self.first = first
+        self.started = started
+        self.ttft = ttft
+        self.record = record
+
+    async def close(self):
+        await self.texts.aclose()
+
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ResilientLLM:
+    """
+    Streams chat completions with timeouts, retries, optional hedging and model fallback.
+
+    The llm_providers.LLMProvider objects in `providers` are tried in order.
+    Each call must connect within `connect_timeout` and produce its first token
+    within `first_token_timeout`. Failures before the first token are retried up
+    to `max_retries` times with jittered exponential backoff, then the next
+    provider is tried. Nothing is
+    retried once text has reached the caller.
+
+    With `hedge_percentile` set (e.g. 0.95), a call with no token after that
+    percentile of recent time-to-first-token gets an identical second call;
+    the first to answer is used and the other is cancelled.
+
+    Every attempt is recorded (model, outcome, TTFT, duration) in `recent`,
+    and in the `attempts` list passed to stream() if one is given.
+    """
+
+    def __init__(self, providers, connect_timeout=5.0, first_token_timeout=20.0, read_timeout=30.0,
+                 max_retries=2, backoff_seconds=0.5, max_backoff_seconds=4.0,
+                 hedge_percentile=None, hedge_min_samples=20):
+        self.providers = list(providers)
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.recent = deque(maxlen=RECENT_ATTEMPTS)
+        self.ttfts = deque(maxlen=RECENT_ATTEMPTS)
+        self.outcomes = Counter()
+
+    def _record(self, record, outcome, started, error=None, attempts=None):
+        record["outcome"] = outcome
+        record["seconds"] = round(time.monotonic() - started, 4)
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        self.recent.append(record)
+        self.outcomes[f"{record['model']}:{outcome}"] += 1
+        if attempts is not None:
+            attempts.append(record)
+
+    def hedge_after(self):
+        """Seconds to wait for a first token before hedging, or None when hedging is off."""
+        if not self.hedge_percentile or len(self.ttfts) < self.hedge_min_samples:
+            return None
+        return percentile(self.ttfts, self.hedge_percentile)
+
+    async def _start(self, provider, messages, temperature):
+        texts = provider.stream(messages, temperature, self.connect_timeout, self.read_timeout)
+        try:
+            first = await anext(texts, None)
+        except BaseException:
+            await texts.aclose()
+            raise
+        return texts, first
+
+    async def _open(self, provider, messages, temperature, attempt, attempts, hedge=False):
+        """Start one call and wait for its first token, recording the attempt if it fails."""
+        started = time.monotonic()
+        record = {"model": provider.name, "attempt": attempt, "hedge": hedge}
+        try:
+            texts, first = await asyncio.wait_for(
+                self._start(provider, messages, temperature), self.first_token_timeout)
+        except asyncio.CancelledError:
+            self._record(record, "cancelled", started, attempts=attempts)
+            raise
+        except Exception as e:
+            outcome = "timeout" if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)) else "error"
+            self._record(record, outcome, started, e, attempts)
+            raise
+        ttft = time.monotonic() - started
+        record["ttft"] = round(ttft, 4)
+        return OpenedStream(texts, first, started, ttft, record)
+
+    async def _open_hedged(self, provider, messages, temperature, attempt, attempts):
+        """Start a call and, if it is slow to produce a token, race a second one against it."""
+        hedge_after = self.hedge_after()
+        if hedge_after is None:
+            return await self._open(provider, messages, temperature, attempt, attempts)
+
+        tasks = [asyncio.create_task(self._open(provider, messages, temperature, attempt, attempts))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                tasks.append(asyncio.create_task(
+                    self._open(provider, messages, temperature, attempt, attempts, hedge=True)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            for task in tasks:
+                if task is winner:
+                    continue
+                try:
+                    opened = await task
+                except BaseException:
+                    continue
+                # Both calls answered at the same moment; drop the loser
+                await opened.close()
+                self._record(opened.record, "cancelled", opened.started, attempts=attempts)
+
+    async def _open_with_retries(self, provider, messages, temperature, attempts):
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=wait_random_exponential(multiplier=self.backoff_seconds, max=self.max_backoff_seconds),
+            retry=retry_if_exception(is_retryable),
+            reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await self._open_hedged(provider, messages, temperature,
+                                               attempt.retry_state.attempt_number, attempts)
+
+    async def stream(self, messages, temperature=0.1, attempts=None) -> AsyncGenerator[str, None]:
+        """
+        Stream the answer text. Raises LLMUnavailable if no model produced any text;
+        errors after the first token are raised as they are.
+        """
+        error = None
+        for provider in self.providers:
+            try:
+                opened = await self._open_with_retries(provider, messages, temperature, attempts)
+            except Exception as e:
+                error = e
+                print(f"LLM {provider.name} failed before answering: {type(e).__name__}: {e}")
+                continue
+
+            self.ttfts.append(opened.ttft)
+            outcome, failure = "ok", None
+            try:
+                if opened.first is not None:
+                    yield opened.first
+                async for text in opened.texts:
+                    yield text
+            except Exception as e:
+                outcome, failure = "error", e
+                raise
+            except BaseException:
+                # The caller stopped reading (client gone or task cancelled)
+                outcome = "cancelled"
+                raise
+            finally:
+                await opened.close()
+                self._record(opened.record, outcome, opened.started, failure, attempts)
+            return
+        raise LLMUnavailable(f"All models failed: {error}") from error
+
+    async def complete(self, messages, temperature=0.1, attempts=None):
+        """Non-streaming answer, with the same timeouts, retries and fallback as stream()."""
+        parts = []
+        async for text in self.stream(messages, temperature, attempts):
+            parts.append(text)
+        return "".join(parts)
+
+    def stats(self):
+        return {
+            "models": [provider.name for provider in self.providers],
+            "outcomes": dict(self.outcomes),
+            "ttft_p50": percentile(self.ttfts, 0.5),
+            "ttft_p95": percentile(self.ttfts, 0.95),
+            "hedge_after": self.hedge_after(),
+            "recent": list(self.recent)[-20:],
+        }
+
+
+def create_llm(providers):
+    """ResilientLLM over `providers`, configured from LLM_* environment variables."""
+    hedge = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+    return ResilientLLM(
+        providers,
+        connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+        first_token_timeout=float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "20")),
+        read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "30")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        hedge_percentile=hedge if hedge > 0 else None
+    )
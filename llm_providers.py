@@ -0,0 +1,132 @@
+import asyncio
+import os
+import random
+from typing import AsyncGenerator
+
+import httpx
+from openai import AsyncOpenAI
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_DEFAULT_MODEL = "google/gemini-2.0-flash-001"
+
+MOCK_FILLER = ("The catalog lists this item with its product code, size, color and price. "
+               "Please check the product page for the latest stock status before ordering.")
+
+
+class LLMProvider:
+    """
+    Interface for chat model backends.
+    stream() yields the answer text piece by piece. Closing the generator
+    early must release the upstream call.
+    """
+
+    name = "provider"
+
+    def stream(self, messages, temperature=0.1, connect_timeout=None, read_timeout=None) -> AsyncGenerator[str, None]:
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    """A model behind an OpenAI-compatible API (OpenAI itself, OpenRouter, ...)."""
+
+    def __init__(self, client, model, name=None):
+        self.client = client
+        self.model = model
+        self.name = name or model
+
+    async def stream(self, messages, temperature=0.1, connect_timeout=None, read_timeout=None) -> AsyncGenerator[str, None]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await response.close()
+
+
+class MockProviderError(ConnectionError):
+    """Simulated upstream failure."""
+
+
+class MockProvider(LLMProvider):
+    """
+    Offline stand-in for a real model, for load tests, profiling and runs without network access.
+
+    Waits `ttft` seconds (plus up to `ttft_jitter` of it at random) before the
+    first token, then emits `answer_tokens` word tokens at `tokens_per_second`.
+    A call fails before its first token with probability `error_rate`.
+    Given the same `seed`, the n-th call always behaves the same way.
+    """
+
+    def __init__(self, ttft=0.3, tokens_per_second=50.0, error_rate=0.0, answer_tokens=60,
+                 ttft_jitter=0.0, seed=0, name="mock"):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.answer_tokens = answer_tokens
+        self.ttft_jitter = ttft_jitter
+        self.seed = seed
+        self.name = name
+        self.calls = 0
+
+    def answer(self, messages):
+        """The text a call with these messages produces: the question echoed, then filler."""
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        words = f"Mock answer to: {' '.join(question.split())}.".split()
+        filler = MOCK_FILLER.split()
+        while len(words) < self.answer_tokens:
+            words.extend(filler)
+        return " ".join(words[:max(self.answer_tokens, 1)])
+
+    async def stream(self, messages, temperature=0.1, connect_timeout=None, read_timeout=None) -> AsyncGenerator[str, None]:
+        self.calls += 1
+        rng = random.Random(f"{self.seed}:{self.calls}")
+        await asyncio.sleep(self.ttft * (1 + self.ttft_jitter * rng.random()))
+        if rng.random() < self.error_rate:
+            raise MockProviderError(f"simulated upstream error (call {self.calls})")
+
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for index, word in enumerate(self.answer(messages).split(" ")):
+            if index:
+                await asyncio.sleep(interval)
+            yield word if index == 0 else " " + word
+
+
+def openrouter_provider(model=OPENROUTER_DEFAULT_MODEL):
+    """A model served through OpenRouter."""
+    return OpenAIProvider(AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=os.getenv("OPENROUTER_API_KEY")), model)
+
+
+def mock_provider():
+    """MockProvider configured from MOCK_LLM_* environment variables."""
+    return MockProvider(
+        ttft=float(os.getenv("MOCK_LLM_TTFT", "0.3")),
+        tokens_per_second=float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50")),
+        error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+        answer_tokens=int(os.getenv("MOCK_LLM_ANSWER_TOKENS", "60")),
+        ttft_jitter=float(os.getenv("MOCK_LLM_TTFT_JITTER", "0")),
+        seed=int(os.getenv("MOCK_LLM_SEED", "0"))
+    )
+
+
+def default_providers(primary):
+    """
+    Providers to use, in fallback order. `primary` is a function returning the main provider.
+    LLM_PROVIDER=mock replaces everything with the offline mock, so no API
+    keys are needed. Otherwise the primary provider comes first, followed by
+    LLM_FALLBACK_MODEL (default google/gemini-2.0-flash-001) on OpenRouter when
+    OPENROUTER_API_KEY is set; LLM_FALLBACK_MODEL="" switches the fallback off.
+    """
+    if os.getenv("LLM_PROVIDER", "").lower() == "mock":
+        return [mock_provider()]
+    providers = [primary()]
+    fallback = os.getenv("LLM_FALLBACK_MODEL", OPENROUTER_DEFAULT_MODEL)
+    if fallback and fallback != providers[0].name and os.getenv("OPENROUTER_API_KEY"):
+        providers.append(openrouter_provider(fallback))
+    return providers
@@ -1,17 +1,43 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
+import hashlib
 import json
+import os
+import time
 import uuid
 from datetime import datetime
 
-# Import our ProductRAG class
-from product_rag import ProductRAG
+# Import our catalog and RAG components
+from answer_cache import InMemoryAnswerCache
+from catalog_snapshot import CatalogManager
+from chat_store import DEFAULT_CHAT_TITLE, create_chat_store
+from catalog_index import estimate_tokens
+from concurrency import AdmissionLimiter, Overloaded
+from metrics import create_instrumentation
+from single_flight import SingleFlight
+from generation import DONE, GenerationRegistry, parse_event_id
+from sse import coalesce
 
-app = FastAPI(title="Product RAG API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Watch the catalog files while the server runs
+    if CATALOG_WATCH:
+        catalog.start_watching()
+    yield
+    catalog.stop_watching()
+    await generations.cancel_all()
+    # Let partial answers of disconnected clients finish saving
+    if detached_tasks:
+        await asyncio.gather(*detached_tasks, return_exceptions=True)
+    await chat_store.close()
+    instrumentation.flush()
+
+app = FastAPI(title="Product RAG API", lifespan=lifespan)
 
 # Configure CORS for Next.js frontend
 app.add_middleware(
@@ -22,16 +48,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for chats and messages
-# In a real application, you would use a database
-chats = {}
+# Storage for chats and messages: "sqlite" (durable, default) or "memory"
+chat_store = create_chat_store(os.getenv("CHAT_STORE", "sqlite"), os.getenv("CHAT_DB_PATH", "chats.db"))
+
+# Cache for repeated questions; ANSWER_CACHE_TTL=0 disables it
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+answer_cache = InMemoryAnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    ttl_seconds=ANSWER_CACHE_TTL
+) if ANSWER_CACHE_TTL > 0 else None
+
+# Limits concurrent upstream LLM calls; extra calls queue up to LLM_QUEUE_TIMEOUT seconds
+upstream_limiter = AdmissionLimiter(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    adaptive=os.getenv("LLM_ADAPTIVE_CONCURRENCY", "").lower() in ("1", "true", "yes"),
+    target_latency=float(os.getenv("LLM_TARGET_LATENCY", "10"))
+)
+
+# Per-request timing spans and counters for /metrics (METRICS_ENABLED, METRICS_LANGFUSE)
+instrumentation = create_instrumentation()
+instrumentation.metrics.gauge("rag_upstream_in_flight", "Upstream LLM calls in progress",
+                              lambda: upstream_limiter.in_flight)
+instrumentation.metrics.gauge("rag_upstream_queue_depth", "Requests waiting for an upstream slot",
+                              lambda: len(upstream_limiter.waiters))
+
+# Upstream slot reservations in progress, by answer key. Identical questions arriving meanwhile wait
+# for the first one's reservation and then share its answer (single-flight) instead of taking a slot;
+# the future's result is the Overloaded error if the reservation was refused, else None
+upstream_admissions = {}
+
+# Load the catalog once at startup; it is hot-reloaded when the source files change.
+# The context selector is "bm25" (default), "vector" or "hybrid" (vector fused with BM25).
+catalog = CatalogManager(
+    "product_catalog.md", "anton_products.json", "anton_products.csv",
+    cache=answer_cache,
+    single_flight=SingleFlight(),
+    limiter=upstream_limiter,
+    retriever=os.getenv("RAG_RETRIEVER", "bm25").lower(),
+    hybrid_alpha=float(os.getenv("RAG_HYBRID_ALPHA", "0.6"))
+)
+
+# Set CATALOG_WATCH=0 to only reload through the admin endpoint
+CATALOG_WATCH = os.getenv("CATALOG_WATCH", "1").lower() in ("1", "true", "yes")
 
-# Load product data once at startup
-with open("product_catalog.md", "r", encoding="utf-8") as f:
-    product_data = f.read()
+# Protects POST /api/catalog/reload when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-# Create a single instance of ProductRAG
-rag = ProductRAG(markdown_content=product_data)
+# When enabled, each stream ends with an event listing the products used as context
+RAG_DEBUG = os.getenv("RAG_DEBUG", "").lower() in ("1", "true", "yes")
 
 # Models
 class Message(BaseModel):
@@ -39,6 +106,7 @@ class Message(BaseModel):
     role: str
     content: str
     created_at: str
+    status: Optional[str] = None
 
 class Chat(BaseModel):
     id: str
@@ -55,71 +123,91 @@ class ChatResponse(BaseModel):
     title: str
     created_at: str
 
+# Answers being generated, by message id, for streaming and resuming
+generations = GenerationRegistry()
+
+# Only the worker that claims an answer in the chat store generates it; a claim older than
+# GENERATION_LEASE_SECONDS is taken over (its worker most likely died). A worker asked for an
+# answer another one is generating checks the store every ANSWER_POLL_SECONDS and replays it once stored
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+GENERATION_LEASE_SECONDS = float(os.getenv("GENERATION_LEASE_SECONDS", "300"))
+ANSWER_POLL_SECONDS = float(os.getenv("ANSWER_POLL_SECONDS", "0.5"))
+
+# WebSocket sessions: frames queued per connection, and answers streaming at once per connection
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "64"))
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "4"))
+
+# Writes that must finish even though the request that started them was cancelled
+detached_tasks = set()
+
+def run_detached(coroutine):
+    task = asyncio.create_task(coroutine)
+    detached_tasks.add(task)
+    task.add_done_callback(detached_tasks.discard)
+    return task
+
+def overloaded_response(retry_after, **details):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, please retry later", **details},
+        headers={"Retry-After": str(retry_after)}
+    )
+
 # Routes
 @app.get("/api/chats", response_model=List[ChatResponse])
-async def get_chats():
-    return [
-        ChatResponse(id=chat_id, title=chat["title"], created_at=chat["created_at"])
-        for chat_id, chat in chats.items()
-    ]
+async def get_chats(if_none_match: Optional[str] = Header(None)):
+    chats = [ChatResponse(**chat).model_dump() for chat in await chat_store.list_chats()]
+    # The ETag is a hash of the list, so it agrees across workers; a client that
+    # already has this list gets 304 instead of downloading it again
+    body = json.dumps(chats).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if if_none_match and etag in if_none_match:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/api/chats", response_model=ChatResponse)
 async def create_chat():
-    chat_id = str(uuid.uuid4())
-    created_at = datetime.now().isoformat()
-    chats[chat_id] = {
-        "id": chat_id,
-        "title": "New Chat",
-        "messages": [],
-        "created_at": created_at
-    }
-    return ChatResponse(id=chat_id, title="New Chat", created_at=created_at)
+    return ChatResponse(**await chat_store.create_chat())
 
 @app.get("/api/chats/{chat_id}", response_model=Chat)
 async def get_chat(chat_id: str):
-    if chat_id not in chats:
+    chat = await chat_store.get_chat(chat_id)
+    if chat is None:
         raise HTTPException(status_code=404, detail="Chat not found")
-    return chats[chat_id]
+    return chat
 
 @app.post("/api/chats/{chat_id}/title")
 async def update_chat_title(chat_id: str, title: str):
-    if chat_id not in chats:
+    if not await chat_store.update_chat_title(chat_id, title):
         raise HTTPException(status_code=404, detail="Chat not found")
-    chats[chat_id]["title"] = title
     return {"success": True}
 
 @app.post("/api/messages")
 async def create_message(message_request: MessageRequest):
+    return await add_question(message_request)
+
+@app.post("/api/messages/stream")
+async def create_and_stream_message(message_request: MessageRequest):
+    # One round trip: store the question and stream the answer, with the ids in the first event
+    # so the client can resume with GET /api/messages/{message_id}/stream if the connection drops
+    ids = await add_question(message_request)
+    return await open_stream(ids["message_id"], ids["chat_id"], None, opening=ids)
+
+async def add_question(message_request):
+    """Store the user message and an empty assistant message; returns their chat and assistant message ids."""
     # Create a new chat if chat_id is not provided
-    chat_id = message_request.chat_id
-    if not chat_id or chat_id not in chats:
-        chat_id = str(uuid.uuid4())
-        created_at = datetime.now().isoformat()
-        chats[chat_id] = {
-            "id": chat_id,
-            "title": "New Chat",
-            "messages": [],
-            "created_at": created_at
-        }
-    
-    # Add user message to chat
-    user_message_id = str(uuid.uuid4())
+    chat = await chat_store.get_chat_info(message_request.chat_id) if message_request.chat_id else None
+    if chat is None:
+        chat = {**await chat_store.create_chat(), "message_count": 0}
+    chat_id = chat["id"]
+    
+    # User message plus the assistant message placeholder
     user_message = {
-        "id": user_message_id,
+        "id": str(uuid.uuid4()),
         "role": "user",
         "content": message_request.content,
         "created_at": datetime.now().isoformat()
     }
-    chats[chat_id]["messages"].append(user_message)
-    
-    # Update chat title if it's the first message
-    if chats[chat_id]["title"] == "New Chat" and len(chats[chat_id]["messages"]) == 1:
-        title = message_request.content
-        if len(title) > 30:
-            title = title[:27] + "..."
-        chats[chat_id]["title"] = title
-    
-    # Add assistant message placeholder
     assistant_message_id = str(uuid.uuid4())
     assistant_message = {
         "id": assistant_message_id,
@@ -127,7 +215,15 @@ async def create_message(message_request: MessageRequest):
         "content": "",
         "created_at": datetime.now().isoformat()
     }
-    chats[chat_id]["messages"].append(assistant_message)
+    
+    # Update chat title if it's the first message
+    title = None
+    if chat["title"] == DEFAULT_CHAT_TITLE and chat["message_count"] == 0:
+        title = message_request.content
+        if len(title) > 30:
+            title = title[:27] + "..."
+    
+    await chat_store.add_messages(chat_id, [user_message, assistant_message], title=title)
     
     return {
         "chat_id": chat_id,
@@ -135,46 +231,363 @@ async def create_message(message_request: MessageRequest):
     }
 
 @app.get("/api/messages/{message_id}/stream")
-async def stream_message(message_id: str, chat_id: str):
+async def stream_message(message_id: str, chat_id: str, last_event_id: Optional[str] = Header(None)):
+    return await open_stream(message_id, chat_id, parse_event_id(last_event_id))
+
+async def open_stream(message_id, chat_id, resume_from, opening=None):
+    """SSE response for an assistant message's answer; `opening` is sent as the first event."""
+    try:
+        generation = await get_generation(message_id, chat_id, resume_from, opening)
+    except Overloaded as e:
+        return overloaded_response(e.retry_after, **(opening or {}))
+    return event_stream(generation, resume_from)
+
+def publish_stored(generation, message):
+    """Replay a stored answer into a generation: all of its text at once, its status if any, then DONE."""
+    generation.publish(json.dumps({"content": message["content"], "reset": True}), message["content"])
+    if message.get("status"):
+        generation.publish(json.dumps({"status": message["status"]}))
+    generation.publish(DONE)
+
+async def get_generation(message_id, chat_id, resume_from=None, opening=None):
+    """
+    The generation for an assistant message: the one already running for it,
+    a replay of its stored answer, or a new one. An answer another worker is
+    generating is replayed once that worker has stored it. Raises
+    HTTPException(404) for unknown messages and Overloaded when no upstream
+    slot is free.
+    """
+    # A client that reconnects (sending Last-Event-ID) continues the answer already being generated
+    generation = generations.get(message_id, chat_id)
+    if generation is not None:
+        if resume_from is not None:
+            generations.resumed += 1
+        return generation
+    
+    trace = instrumentation.new_trace("stream_message")
+    
     # Find the chat and message
-    if chat_id not in chats:
+    trace.start("load_history")
+    if await chat_store.get_chat_info(chat_id) is None:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    # Find the message with the given ID
-    for i, message in enumerate(chats[chat_id]["messages"]):
-        if message["id"] == message_id and message["role"] == "assistant":
-            # Get the previous user message
-            if i > 0 and chats[chat_id]["messages"][i-1]["role"] == "user":
-                user_message = chats[chat_id]["messages"][i-1]["content"]
-                break
-    else:
+    # Find the message with the given ID and the user message before it
+    message = await chat_store.get_message(chat_id, message_id)
+    previous = await chat_store.get_messages_before(chat_id, message_id) if message else []
+    if not message or message["role"] != "assistant" or not previous or previous[-1]["role"] != "user":
         raise HTTPException(status_code=404, detail="Message not found")
+    user_message = previous[-1]["content"]
+    trace.end("load_history")
+    
+    # An answer that was already stored (e.g. its buffer was evicted) is replayed, not generated again
+    if message["content"]:
+        async def replay(generation):
+            publish_stored(generation, message)
+        trace.finish()
+        return generations.start(message_id, chat_id, replay, replay=True)
+    
+    # A resume that reached a worker without the answer's buffer must not start a second generation
+    # (a second upstream call and two writers on one message): wait for the owner to store it instead
+    if not await chat_store.claim_message(chat_id, message_id, WORKER_ID, GENERATION_LEASE_SECONDS):
+        async def replay_when_stored(generation):
+            stored = {**message, "status": "generating"}
+            deadline = time.monotonic() + GENERATION_LEASE_SECONDS
+            while stored["status"] == "generating":
+                if time.monotonic() > deadline:
+                    stored = {**stored, "status": "truncated"}
+                    break
+                await asyncio.sleep(ANSWER_POLL_SECONDS)
+                stored = await chat_store.get_message(chat_id, message_id) or {**stored, "status": "truncated"}
+            publish_stored(generation, stored)
+        trace.finish()
+        generation = generations.get(message_id, chat_id)
+        return generation or generations.start(message_id, chat_id, replay_when_stored, replay=True)
+    
+    def release_claim():
+        # Nothing will be generated after all; let the next request (on any worker) claim it
+        if generations.get(message_id, chat_id) is None:
+            run_detached(chat_store.update_message(chat_id, message_id, ""))
     
-    # Stream the response
-    async def event_generator():
-        full_response = ""
-        async for chunk in rag.stream_query(user_message):
-            full_response += chunk
-            yield f"data: {json.dumps({'content': chunk})}\n\n"
-        
-        # Update the message in our storage with the full response
-        for message in chats[chat_id]["messages"]:
-            if message["id"] == message_id:
-                message["content"] = full_response
-                break
-                
-        yield f"data: [DONE]\n\n"
+    # Earlier turns give follow-up questions their context; ProductRAG trims them to its token budget
+    history = [{"role": m["role"], "content": m["content"]} for m in previous[:-1] if m["content"]]
     
+    # Pin the catalog version for the whole answer, even if a reload happens meanwhile
+    snapshot = catalog.current
+    
+    # Questions that need the LLM wait for an upstream slot before streaming starts,
+    # so a full queue or a queue timeout can still be answered with 429
+    decision = snapshot.router.route(user_message, history)
+    routed_to_llm = decision.source == "llm"
+    # Cache hits and joiners of an identical answer make no upstream call, so they take no slot
+    # (if that answer expires or ends in the meantime, ProductRAG acquires a slot itself)
+    needs_llm = False
+    if routed_to_llm:
+        key = snapshot.rag.answer_key(user_message, history)
+        admission = upstream_admissions.get(key)
+        if admission is not None:
+            with trace.span("queue_wait"):
+                refused = await asyncio.shield(admission)
+            if refused is not None:
+                trace.error("overloaded")
+                trace.finish()
+                release_claim()
+                raise Overloaded(refused.retry_after, refused.reason)
+        else:
+            needs_llm = not snapshot.rag.has_answer(key)
+    admission = None
+    if needs_llm:
+        # Stays registered until this answer is done, so identical questions join it rather than
+        # starting a second upstream call before this one has reached single-flight
+        admission = asyncio.get_running_loop().create_future()
+        upstream_admissions[key] = admission
+        try:
+            with trace.span("queue_wait"):
+                await upstream_limiter.acquire()
+        except BaseException as e:
+            refused = e if isinstance(e, Overloaded) else None
+            admission.set_result(refused)
+            del upstream_admissions[key]
+            if refused is not None:
+                trace.error("overloaded")
+                trace.finish()
+            release_claim()
+            raise
+        admission.set_result(None)
+    slot = {"held": needs_llm, "started": time.monotonic(), "ran": False}
+    trace.set("source", "llm" if routed_to_llm else "fast_path")
+    
+    def release_slot(failed=False):
+        if slot["held"]:
+            slot["held"] = False
+            upstream_limiter.release(time.monotonic() - slot["started"], failed)
+        if admission is not None and upstream_admissions.get(key) is admission:
+            del upstream_admissions[key]
+    
+    # Another request for this message may have started it while we waited for a slot
+    generation = generations.get(message_id, chat_id)
+    if generation is not None:
+        release_slot()
+        return generation
+    
+    async def answer_chunks(parts, debug):
+        trace.start("first_token")
+        async for chunk in snapshot.router.stream_query(user_message, history=history, debug=debug,
+                                                        admitted=needs_llm, trace=trace, decision=decision):
+            if not parts:
+                trace.end("first_token")
+                trace.start("streaming")
+            parts.append(chunk)
+            yield chunk
+        trace.end("streaming")
+    
+    # The answer is generated in the background into a resumable event buffer. It keeps going
+    # while the client reconnects; if nobody is reading for RESUME_GRACE_SECONDS it is cancelled,
+    # which also cancels the upstream LLM stream (through coalesce and single-flight).
+    async def produce(generation):
+        slot["ran"] = True
+        parts = []
+        debug = {}
+        failed = False
+        answered = False
+        stored = False
+        if opening:
+            generation.publish(json.dumps(opening))
+        try:
+            try:
+                # Tokens are batched into events every few milliseconds
+                async for text in coalesce(answer_chunks(parts, debug)):
+                    generation.publish(json.dumps({"content": text}), text)
+                answered = True
+            except Exception as e:
+                failed = True
+                trace.error("stream")
+                print(f"Error generating answer: {e}")
+                return
+            finally:
+                release_slot(failed or "error" in debug)
+            
+            # Tell the client whether the answer came from the fast path or the LLM
+            generation.publish(json.dumps({"source": debug.get("source", "llm")}))
+            
+            if RAG_DEBUG:
+                generation.publish(json.dumps({"debug": debug}))
+            
+            # Store the full response with a single write
+            with trace.span("store_answer"):
+                await chat_store.update_message(chat_id, message_id, "".join(parts))
+            stored = True
+            
+            generation.publish(DONE)
+        finally:
+            if not stored:
+                # Keep what was generated; an unfinished answer is marked truncated
+                status = None if answered else "truncated"
+                run_detached(chat_store.update_message(chat_id, message_id, "".join(parts), status=status))
+                if not answered and not failed:
+                    trace.error("client_disconnect")
+            if "error" in debug:
+                trace.error("llm")
+            trace.finish(output_tokens=estimate_tokens("".join(parts)))
+    
+    generation = generations.start(message_id, chat_id, produce)
+    # Covers a generation cancelled before it ever ran
+    def cleanup(_task):
+        release_slot()
+        trace.finish()
+        if not slot["ran"]:
+            run_detached(chat_store.update_message(chat_id, message_id, ""))
+    generation.task.add_done_callback(cleanup)
+    return generation
+
+def event_stream(generation, last_event_id):
     return StreamingResponse(
-        event_generator(),
+        generation.subscribe(last_event_id),
         media_type="text/event-stream"
     )
 
+@app.websocket("/api/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    A whole chat session over one WebSocket. Client messages are JSON objects:
+      {"type": "message", "content": ..., "chat_id": ...}   ask a question (chat_id optional)
+      {"type": "resume", "chat_id": ..., "message_id": ..., "last_event_id": ...}
+      {"type": "cancel", "chat_id": ..., "message_id": ...}  stop generating an answer
+    The server answers with "created" (the ids), then "event" messages carrying
+    the same numbered payloads as the SSE stream, then "done" ("complete": false
+    if the answer was cancelled or failed). Resuming works across transports.
+    """
+    await websocket.accept()
+    # Bounded: when the client reads slowly, forwarding stops and the answer waits in its
+    # generation's buffer instead of piling up here
+    outbox = asyncio.Queue(maxsize=WS_SEND_QUEUE)
+    streams = {}
+    
+    async def send_outbox():
+        while True:
+            await websocket.send_text(await outbox.get())
+    
+    async def send(message):
+        await outbox.put(json.dumps(message))
+    
+    async def forward(generation, last_event_id):
+        prefix = f'{{"type": "event", "message_id": "{generation.message_id}", "id": '
+        async with aclosing(generation.follow(last_event_id)) as events:
+            async for event in events:
+                if event is None:
+                    await send({"type": "ping"})
+                elif event[1] != DONE:
+                    # Payloads are JSON already; wrap them without decoding
+                    await outbox.put(f'{prefix}{event[0]}, "data": {event[1]}}}')
+        await send({"type": "done", "message_id": generation.message_id, "complete": generation.complete})
+    
+    def start_forwarding(generation, last_event_id=None):
+        task = asyncio.create_task(forward(generation, last_event_id))
+        streams[generation.message_id] = task
+        task.add_done_callback(lambda _task: streams.pop(generation.message_id, None))
+    
+    async def handle(request):
+        kind = request.get("type")
+        message_id = request.get("message_id")
+        if kind == "cancel":
+            generation = generations.get(message_id, request.get("chat_id"))
+            if generation is not None:
+                generation.cancel()
+            return
+        if kind not in ("message", "resume"):
+            await send({"type": "error", "detail": f"Unknown message type: {kind}"})
+            return
+        if len(streams) >= WS_MAX_STREAMS:
+            await send({"type": "error", "detail": "Too many answers streaming on this connection"})
+            return
+        if kind == "message":
+            ids = await add_question(MessageRequest(chat_id=request.get("chat_id"),
+                                                    content=str(request.get("content", ""))))
+            await send({"type": "created", **ids})
+            message_id, chat_id, resume_from = ids["message_id"], ids["chat_id"], None
+        else:
+            chat_id, resume_from = request.get("chat_id"), parse_event_id(request.get("last_event_id"))
+        if message_id in streams:
+            return
+        try:
+            generation = await get_generation(message_id, chat_id, resume_from)
+        except Overloaded as e:
+            await send({"type": "error", "message_id": message_id, "status": 429,
+                        "detail": "Too many requests, please retry later", "retry_after": e.retry_after})
+            return
+        except HTTPException as e:
+            await send({"type": "error", "message_id": message_id, "status": e.status_code, "detail": e.detail})
+            return
+        start_forwarding(generation, resume_from)
+    
+    sender = asyncio.create_task(send_outbox())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                request = json.loads(text)
+            except ValueError:
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            if isinstance(request, dict):
+                await handle(request)
+            else:
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Unread answers keep generating for the resume grace period, as with SSE
+        tasks = [sender, *streams.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+@app.get("/api/streams")
+async def get_stream_stats():
+    return generations.stats()
+
+@app.get("/api/health")
+async def health():
+    # The pid tells apart the uvicorn workers behind one port
+    return {"status": "ok", "pid": os.getpid(), "catalog_version": catalog.current.version}
+
+@app.get("/api/router/stats")
+async def get_router_stats():
+    stats = catalog.current.router.stats
+    total = sum(stats.values())
+    return {
+        **stats,
+        "fast_path_rate": stats["fast_path"] / total if total else 0.0
+    }
+
+@app.get("/api/limiter")
+async def get_limiter_metrics():
+    return upstream_limiter.metrics()
+
+@app.get("/api/llm")
+async def get_llm_stats():
+    # Outcome of every recent upstream attempt: retries, timeouts, hedges and fallbacks
+    return catalog.current.rag.llm.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format; each uvicorn worker reports its own requests
+    return instrumentation.metrics.render()
+
+@app.get("/api/catalog")
+async def get_catalog_status():
+    return catalog.status()
+
+@app.post("/api/catalog/reload")
+async def reload_catalog(x_admin_token: Optional[str] = Header(None)):
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    reloaded = await catalog.reload()
+    return {"reloaded": reloaded, **catalog.status()}
+
 @app.delete("/api/chats/{chat_id}")
 async def delete_chat(chat_id: str):
-    if chat_id not in chats:
+    if not await chat_store.delete_chat(chat_id):
         raise HTTPException(status_code=404, detail="Chat not found")
-    del chats[chat_id]
     return {"success": True}
 
 if __name__ == "__main__":
@@ -0,0 +1,272 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Seconds buckets for request phases; token buckets for prompt and answer sizes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels_text(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_labels_text(key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_labels_text(key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels_text(key)} {value}" for key, value in sorted(self.series.items()))
+        return lines
+
+
+class Gauge:
+    """A value read from a function when metrics are rendered."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Metrics:
+    """
+    Process-wide request metrics. Each uvicorn worker keeps its own, so
+    /metrics shows the worker that answered the scrape.
+    """
+
+    def __init__(self):
+        self.phase_seconds = Histogram("rag_request_phase_seconds", "Time spent in each phase of a chat request")
+        self.prompt_tokens = Histogram("rag_prompt_tokens", "Estimated prompt tokens sent to the LLM", TOKEN_BUCKETS)
+        self.output_tokens = Histogram("rag_output_tokens", "Estimated tokens in each answer", TOKEN_BUCKETS)
+        self.requests = Counter("rag_requests_total", "Answered chat requests by source")
+        self.cache = Counter("rag_answer_cache_total", "Answer cache lookups by result")
+        self.errors = Counter("rag_errors_total", "Failed chat requests by kind")
+        self.gauges = []
+
+    def gauge(self, name, help, read):
+        self.gauges.append(Gauge(name, help, read))
+
+    def render(self):
+        lines = []
+        for metric in (self.phase_seconds, self.prompt_tokens, self.output_tokens,
+                       self.requests, self.cache, self.errors, *self.gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTrace:
+    """Stands in for RequestTrace when instrumentation is off; every method does nothing."""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def start(self, name):
+        pass
+
+    def end(self, name):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def count(self, counter, **labels):
+        pass
+
+    def error(self, kind):
+        pass
+
+    def finish(self, **attributes):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class RequestTrace:
+    """
+    Timing spans and counters for one chat request.
+    Spans are recorded with span() as a context manager, or with start()/end()
+    when a phase begins and ends in different places (e.g. across yields).
+    finish() feeds everything into the shared Metrics and the optional exporter.
+    """
+
+    enabled = True
+
+    def __init__(self, metrics, name, exporter=None):
+        self.metrics = metrics
+        self.name = name
+        self.exporter = exporter
+        self.id = uuid.uuid4().hex
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.open = {}
+        self.spans = []
+        self.attributes = {}
+        self.finished = False
+
+    @contextmanager
+    def span(self, name):
+        self.start(name)
+        try:
+            yield self
+        finally:
+            self.end(name)
+
+    def start(self, name):
+        self.open[name] = time.perf_counter()
+
+    def end(self, name):
+        started = self.open.pop(name, None)
+        if started is not None:
+            self.spans.append((name, started - self.started, time.perf_counter() - started))
+
+    def set(self, name, value):
+        self.attributes[name] = value
+
+    def count(self, counter, **labels):
+        getattr(self.metrics, counter).inc(**labels)
+
+    def error(self, kind):
+        self.attributes["error"] = kind
+        self.metrics.errors.inc(kind=kind)
+
+    def finish(self, **attributes):
+        if self.finished:
+            return
+        self.finished = True
+        self.attributes.update(attributes)
+        for name in list(self.open):
+            self.end(name)
+        total = time.perf_counter() - self.started
+        for name, _, seconds in self.spans:
+            self.metrics.phase_seconds.observe(seconds, phase=name)
+        self.metrics.phase_seconds.observe(total, phase="total")
+        if "prompt_tokens" in self.attributes:
+            self.metrics.prompt_tokens.observe(self.attributes["prompt_tokens"])
+        if "output_tokens" in self.attributes:
+            self.metrics.output_tokens.observe(self.attributes["output_tokens"])
+        if "source" in self.attributes:
+            self.metrics.requests.inc(source=self.attributes["source"])
+        if self.exporter is not None:
+            self.exporter.export(self, total)
+
+
+class LangfuseExporter:
+    """
+    Sends each finished request to Langfuse as a trace with one span per phase.
+    The Langfuse client batches and uploads in a background thread.
+    """
+
+    def __init__(self):
+        from langfuse import Langfuse
+        self.client = Langfuse()
+
+    def export(self, trace, total):
+        try:
+            exported = self.client.trace(id=trace.id, name=trace.name, timestamp=trace.started_at,
+                                         metadata={**trace.attributes, "seconds": round(total, 4)})
+            for name, offset, seconds in trace.spans:
+                start_time = trace.started_at + timedelta(seconds=offset)
+                exported.span(name=name, start_time=start_time, end_time=start_time + timedelta(seconds=seconds))
+        except Exception as e:
+            print(f"Error exporting trace to Langfuse: {e}")
+
+    def flush(self):
+        self.client.flush()
+
+
+class Instrumentation:
+    """
+    Entry point for request tracing. With `enabled=False` new_trace() returns
+    NULL_TRACE, so instrumented code costs one method call per span.
+    """
+
+    def __init__(self, enabled=True, exporter=None):
+        self.enabled = enabled
+        self.metrics = Metrics()
+        self.exporter = exporter if enabled else None
+
+    def new_trace(self, name):
+        if not self.enabled:
+            return NULL_TRACE
+        return RequestTrace(self.metrics, name, self.exporter)
+
+    def flush(self):
+        if self.exporter is not None:
+            self.exporter.flush()
+
+
+def create_instrumentation():
+    """
+    Instrumentation configured from METRICS_ENABLED (default on) and
+    METRICS_LANGFUSE (off by default; needs the usual LANGFUSE_* keys).
+    """
+    enabled = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+    exporter = None
+    if enabled and os.getenv("METRICS_LANGFUSE", "").lower() in ("1", "true", "yes"):
+        try:
+            exporter = LangfuseExporter()
+        except Exception as e:
+            print(f"Langfuse export disabled: {e}")
+    return Instrumentation(enabled, exporter)
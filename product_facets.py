@@ -0,0 +1,305 @@
+import os
+import re
+
+import numpy as np
+
+from product_store import COLOR_ALIASES, format_price, normalize_color, normalize_name
+
+# A list question with more matches than this lists the cheapest ones and says how many were left out
+LIST_LIMIT = int(os.getenv("FACET_LIST_LIMIT", "15"))
+
+# "Rs 3,000", "Rs.2,150.00", "3000 LKR", "3k"; not sizes like 25mm or 1000L. The number is matched
+# whole, so it can't give back digits to slip past the unit check right after it ("25mm" as 2)
+AMOUNT = (r"(?:rs\.?|lkr)?\s*((?<!\d)(?<!\d[,.])\d[\d,]*(?:\.\d+)?(?!\d|[,.]\d))"
+          r"(?!\s*(?:mm|cm|m|l|kg|g|ft|inch|litres?|liters?|pcs?|%)\b)(\s*k\b)?\s*(?:rs|lkr|rupees)?")
+PRICE_PATTERNS = [
+    ("range", re.compile(rf"\b(?:between|from)\s+{AMOUNT}\s*(?:and|to|-)\s*{AMOUNT}")),
+    ("max", re.compile(rf"(?:\b(?:under|below|less than|cheaper than|up to|upto|at most|max(?:imum)?|within)|<=?)"
+                       rf"\s*{AMOUNT}")),
+    ("min", re.compile(rf"(?:\b(?:over|above|more than|at least|min(?:imum)?)|>=?)\s*{AMOUNT}")),
+    ("max", re.compile(rf"{AMOUNT}\s+or\s+(?:less|under|below|cheaper)\b")),
+    ("min", re.compile(rf"{AMOUNT}\s+or\s+(?:more|over|above)\b")),
+]
+OUT_OF_STOCK_PATTERN = re.compile(r"\b(?:out of stock|not in stock|not available|unavailable|sold out)\b")
+IN_STOCK_PATTERN = re.compile(r"\b(?:in stock|in-stock)\b")
+
+# Words that may be left over in a question that only asks for a list of products
+LIST_WORDS = {
+    "a", "all", "and", "any", "are", "available", "can", "color", "colors", "colour", "colours", "come",
+    "comes", "cost", "costs", "do", "does", "find", "for", "get", "give", "have", "i", "in", "is",
+    "item", "items", "list", "me", "need", "of", "only", "option", "options", "or", "please", "price",
+    "priced", "prices", "product", "products", "see", "show", "some", "that", "the", "there", "those",
+    "want", "we", "what", "which", "with", "you", "your",
+}
+
+
+def _stem(word):
+    """Singular-ish form, so 'tanks' matches the category 'Water Tanks' and vice versa."""
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _terms(text):
+    return [_stem(COLOR_ALIASES.get(word, word)) for word in normalize_name(text).split()]
+
+
+def _parse_amount(number, thousands):
+    value = float(number.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def _find_phrase(words, phrase):
+    """Start of the first run of `words` equal to `phrase`, or -1."""
+    size = len(phrase)
+    for start in range(len(words) - size + 1):
+        if words[start:start + size] == phrase:
+            return start
+    return -1
+
+
+class FacetFilter:
+    """
+    Structured constraints parsed from a question. `rest` holds the words the
+    parser did not use, so callers can tell a pure list request from a question
+    that only mentions a category or a price in passing.
+    """
+
+    def __init__(self, categories=None, colors=None, min_price=None, max_price=None, in_stock=None, rest=None):
+        self.categories = categories or []
+        self.colors = colors or []
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        self.rest = rest or []
+
+    @property
+    def empty(self):
+        return not (self.categories or self.colors or self.min_price is not None or self.max_price is not None
+                    or self.in_stock is not None)
+
+    @property
+    def is_list_request(self):
+        """Whether the question asks for nothing but the products matching the filter."""
+        return not self.empty and all(word in LIST_WORDS for word in self.rest)
+
+    def describe(self):
+        parts = []
+        if self.categories:
+            parts.append(" or ".join(self.categories))
+        if self.colors:
+            parts.append("in " + " or ".join(self.colors))
+        if self.min_price is not None and self.max_price is not None:
+            parts.append(f"between {format_price(self.min_price)} and {format_price(self.max_price)}")
+        elif self.max_price is not None:
+            parts.append(f"up to {format_price(self.max_price)}")
+        elif self.min_price is not None:
+            parts.append(f"from {format_price(self.min_price)}")
+        if self.in_stock is not None:
+            parts.append("in stock" if self.in_stock else "out of stock")
+        return ", ".join(parts)
+
+    def as_dict(self):
+        return {
+            "categories": self.categories,
+            "colors": self.colors,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "in_stock": self.in_stock,
+        }
+
+    def __repr__(self):
+        return f"FacetFilter({self.describe() or 'empty'})"
+
+
+class FacetMatches:
+    """
+    Products matching a filter: product positions in the store and, per product,
+    the matching rows. `by_variant` is set when the filter selects individual
+    variants (by color or price) rather than whole products.
+    """
+
+    def __init__(self, facets, products, rows, by_variant=False):
+        self.facets = facets
+        self.products = products
+        self.rows = rows
+        self.by_variant = by_variant
+
+    def __len__(self):
+        return len(self.products)
+
+    @property
+    def keys(self):
+        return [self.facets.store.products[index].url for index in self.products]
+
+    @property
+    def variant_codes(self):
+        """{product url: product codes of its matching variants} when only some variants match."""
+        if not self.by_variant:
+            return {}
+        codes = {}
+        for position in self.products:
+            variants = [self.facets.row_variant[row] for row in self.rows[position]]
+            if all(variant is not None for variant in variants):
+                codes[self.facets.store.products[position].url] = {variant.product_code for variant in variants}
+        return codes
+
+
+class FacetIndex:
+    """
+    Typed, columnar view of the ProductStore for filtering by category, color,
+    price and stock. Every variant is one row (a product without variants is a
+    single row priced at its main price):
+
+      row_product  int32    position of the row's product in store.products
+      row_price    float64  variant price, or the product's price; NaN if unknown or 0
+      row_color    int16    code into `colors` (normalized names), -1 if none
+
+    and per product `product_category` (int16 code into `categories`, -1 if
+    none) and `product_stock` (int8: 1 in stock, 0 out of stock, -1 unknown).
+    Category and stock bitmaps are boolean masks over products; color bitmaps
+    are masks over rows. A filter is a handful of vectorized ANDs and ORs over
+    these, so it never touches the Python product objects.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        categories, colors = {}, {}
+        row_product, row_price, row_color, variants = [], [], [], []
+        product_category, product_stock = [], []
+
+        for position, product in enumerate(store.products):
+            category = product.category.strip()
+            product_category.append(categories.setdefault(category, len(categories)) if category else -1)
+            product_stock.append(-1 if product.in_stock is None else int(product.in_stock))
+            for variant in product.variants or [None]:
+                color = normalize_color(variant.color) if variant is not None else ""
+                price = variant.price if variant is not None and variant.price is not None else product.price
+                row_product.append(position)
+                # 0.00 is how the source marks a price that isn't listed
+                row_price.append(price if price else np.nan)
+                row_color.append(colors.setdefault(color, len(colors)) if color else -1)
+                variants.append(variant)
+
+        self.categories = list(categories)
+        self.colors = list(colors)
+        self.row_product = np.array(row_product, dtype=np.int32)
+        self.row_price = np.array(row_price, dtype=np.float64)
+        self.row_color = np.array(row_color, dtype=np.int16)
+        self.row_variant = variants
+        self.product_category = np.array(product_category, dtype=np.int16)
+        self.product_stock = np.array(product_stock, dtype=np.int8)
+
+        self.category_bitmaps = {name: self.product_category == code for code, name in enumerate(self.categories)}
+        self.color_bitmaps = {name: self.row_color == code for code, name in enumerate(self.colors)}
+        self.stock_bitmaps = {True: self.product_stock == 1, False: self.product_stock == 0}
+
+        # Phrases the parser looks for, longest first so "royal blue" wins over "blue"
+        self._category_terms = sorted(((_terms(name), name) for name in self.categories),
+                                      key=lambda item: len(item[0]), reverse=True)
+        color_words = {}
+        for name in self.colors:
+            color_words.setdefault(name, name)
+            # A base color ("blue") also selects its shades ("royal blue", "jasper blue")
+            color_words.setdefault(name.split()[-1], name.split()[-1])
+        self._color_terms = sorted(((_terms(name), name) for name in color_words),
+                                   key=lambda item: len(item[0]), reverse=True)
+
+    def parse(self, question):
+        """The FacetFilter expressed in a question; empty if it names no category, color, price or stock."""
+        text = f" {(question or '').lower()} "
+        min_price = max_price = None
+        for kind, pattern in PRICE_PATTERNS:
+            for match in pattern.finditer(text):
+                groups = match.groups()
+                if kind == "range":
+                    low, high = sorted((_parse_amount(*groups[:2]), _parse_amount(*groups[2:])))
+                    min_price, max_price = low, high
+                elif kind == "max":
+                    max_price = _parse_amount(*groups)
+                else:
+                    min_price = _parse_amount(*groups)
+                text = text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+        in_stock = None
+        for pattern, value in ((OUT_OF_STOCK_PATTERN, False), (IN_STOCK_PATTERN, True)):
+            if pattern.search(text):
+                in_stock = value if in_stock is None else in_stock
+                text = pattern.sub(" ", text)
+
+        words = _terms(text)
+        found = {}
+        for kind, phrases in (("categories", self._category_terms), ("colors", self._color_terms)):
+            found[kind] = []
+            for phrase, name in phrases:
+                start = _find_phrase(words, phrase)
+                if phrase and start >= 0:
+                    found[kind].append(name)
+                    # Consumed words can't match a shorter phrase ("accessories" inside "roofing accessories")
+                    words[start:start + len(phrase)] = [None] * len(phrase)
+        rest = [word for word in words if word is not None]
+        return FacetFilter(found["categories"], found["colors"], min_price, max_price, in_stock, rest)
+
+    def _color_mask(self, phrase):
+        words = phrase.split()
+        mask = np.zeros(len(self.row_color), dtype=bool)
+        for name, bitmap in self.color_bitmaps.items():
+            if _find_phrase(name.split(), words) >= 0:
+                mask |= bitmap
+        return mask
+
+    def match(self, facet_filter):
+        """FacetMatches for a filter, cheapest matching price first."""
+        products = np.ones(len(self.product_stock), dtype=bool)
+        if facet_filter.categories:
+            products &= np.logical_or.reduce([self.category_bitmaps[name] for name in facet_filter.categories])
+        if facet_filter.in_stock is not None:
+            products &= self.stock_bitmaps[facet_filter.in_stock]
+
+        rows = products[self.row_product]
+        if facet_filter.colors:
+            rows &= np.logical_or.reduce([self._color_mask(phrase) for phrase in facet_filter.colors])
+        # Comparisons with NaN are False, so unpriced rows drop out of price filters
+        if facet_filter.min_price is not None:
+            rows &= self.row_price >= facet_filter.min_price
+        if facet_filter.max_price is not None:
+            rows &= self.row_price <= facet_filter.max_price
+
+        matched_rows = np.flatnonzero(rows)
+        positions = self.row_product[matched_rows]
+        prices = np.where(np.isnan(self.row_price[matched_rows]), np.inf, self.row_price[matched_rows])
+        # Cheapest row first, then keep each product's first (cheapest) occurrence
+        order = np.lexsort((matched_rows, prices))
+        matched_rows, positions = matched_rows[order], positions[order]
+        products_found, first = np.unique(positions, return_index=True)
+        products_found = products_found[np.argsort(first)]
+        rows_by_product = {int(position): [] for position in products_found}
+        for row, position in zip(matched_rows.tolist(), positions.tolist()):
+            rows_by_product[position].append(row)
+        by_variant = bool(facet_filter.colors) or facet_filter.min_price is not None or facet_filter.max_price is not None
+        return FacetMatches(self, [int(position) for position in products_found], rows_by_product, by_variant)
+
+    def render_list(self, facet_filter, matches, limit=LIST_LIMIT):
+        """Markdown answer listing the matching products with their matching prices and colors."""
+        heading = facet_filter.describe()
+        if not matches:
+            return f"No products match: {heading}."
+        count = f"{len(matches)} products match" if len(matches) != 1 else "1 product matches"
+        lines = [f"**{count}:** {heading}", ""]
+        for position in matches.products[:limit]:
+            product = self.store.products[position]
+            rows = matches.rows[position]
+            prices = self.row_price[rows]
+            prices = prices[~np.isnan(prices)]
+            if not len(prices):
+                price = format_price(None)
+            elif prices.min() == prices.max():
+                price = format_price(float(prices.min()))
+            else:
+                price = f"{format_price(float(prices.min()))} - {format_price(float(prices.max()))}"
+            colors = sorted({self.colors[code] for code in self.row_color[rows].tolist() if code >= 0})
+            stock = {1: "In stock", 0: "Out of stock", -1: "stock not listed"}[int(self.product_stock[position])]
+            details = [price] + ([", ".join(color.title() for color in colors)] if colors else []) + [stock]
+            lines.append(f"- **{product.name}**: {' | '.join(details)} - {product.url}")
+        if len(matches) > limit:
+            lines.append("")
+            lines.append(f"...and {len(matches) - limit} more. Add a price, color or category to narrow the list.")
+        return "\n".join(lines)
@@ -1,20 +1,62 @@
 import os
 import re
+import time
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from typing import AsyncGenerator
 
+from answer_cache import cache_key, content_hash, replay_chunks
+from catalog_index import CatalogIndex, ContextSelection, estimate_tokens
+from conversation import PromptBudget, fit_history, retrieval_query
+from llm_client import LLMUnavailable, create_llm
+from llm_providers import OpenAIProvider, default_providers
+from metrics import NULL_TRACE
+from product_store import normalize_name
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Create async OpenAI client
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# gpt-4o with timeouts and retries, falling back to a faster OpenRouter model when configured.
+# LLM_PROVIDER=mock answers offline instead (see llm_providers.MockProvider).
+default_llm = create_llm(default_providers(
+    lambda: OpenAIProvider(AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")), "gpt-4o")))
+
+# Shown to the user when no model could answer at all
+UNAVAILABLE_MESSAGE = "Sorry, the assistant is temporarily unavailable. Please try again in a moment."
+
+# Retrieval settings: how many products go into the prompt and how many tokens they may use.
+# A top-k of 0 disables retrieval and sends the whole catalog, as before.
+DEFAULT_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+DEFAULT_MAX_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "6000"))
+
+# Whole-prompt budget shared by instructions, catalog context and chat history,
+# and the largest share of what is left after instructions that history may take
+DEFAULT_MAX_PROMPT_TOKENS = int(os.getenv("RAG_MAX_PROMPT_TOKENS", "8000"))
+DEFAULT_HISTORY_SHARE = float(os.getenv("RAG_HISTORY_SHARE", "0.3"))
 
 class ProductRAG:
-    def __init__(self, markdown_file_path=None, markdown_content=None):
+    def __init__(self, markdown_file_path=None, markdown_content=None,
+                 top_k=DEFAULT_TOP_K, max_context_tokens=DEFAULT_MAX_CONTEXT_TOKENS, retriever=None,
+                 cache=None, single_flight=None, max_prompt_tokens=DEFAULT_MAX_PROMPT_TOKENS,
+                 history_share=DEFAULT_HISTORY_SHARE, limiter=None, llm=None, catalog_index=None, facets=None,
+                 catalog_version=None):
         """
         Initialize the RAG system with product data.
         Either provide a file path or markdown content directly.
+        The catalog is split into per-product chunks and indexed once here.
+        `retriever` optionally replaces the BM25 search (see vector_index.HybridRetriever).
+        `cache` is an optional answer_cache.AnswerCache for repeated questions.
+        `single_flight` is an optional single_flight.SingleFlight that lets identical
+        concurrent questions share one upstream stream.
+        `max_prompt_tokens` and `history_share` set the token budget for multi-turn prompts.
+        `limiter` is an optional concurrency.AdmissionLimiter around upstream calls; when it
+        can't admit a call, concurrency.Overloaded is raised before any output.
+        `llm` is the llm_client.ResilientLLM used for answers (gpt-4o with fallback by default).
+        `catalog_index` is an already built CatalogIndex for this markdown (see CatalogIndex.updated).
+        `facets` is an optional product_facets.FacetIndex; questions that name a category, color,
+        price range or stock status then only retrieve from the products that match.
+        `catalog_version` identifies every source the answers depend on (the markdown, and the
+        product data behind `facets`); it defaults to a hash of the markdown.
         """
         self.markdown_file_path = markdown_file_path
         if markdown_content:
@@ -23,6 +65,23 @@ class ProductRAG:
             self.product_data = self._load_markdown_file()
         else:
             self.product_data = ""
+        
+        self.top_k = top_k
+        self.max_context_tokens = max_context_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.history_share = history_share
+        if catalog_index is not None:
+            self.catalog_index = catalog_index
+        else:
+            self.catalog_index = CatalogIndex(self.product_data) if self.product_data else None
+        self.retriever = retriever
+        self.facets = facets
+        self.cache = cache
+        self.single_flight = single_flight
+        self.limiter = limiter
+        self.llm = llm if llm is not None else default_llm
+        # Part of every cache key, so a catalog change invalidates all cached answers
+        self.catalog_version = catalog_version or content_hash(self.product_data)
     
     def _load_markdown_file(self):
         """Load and read the markdown file."""
@@ -33,15 +92,68 @@ class ProductRAG:
             print(f"Error loading markdown file: {e}")
             return ""
     
-    def get_system_prompt(self, user_question=None):
+    def select_context(self, user_question=None, max_tokens=None):
+        """
+        Pick the catalog context for a question.
+        Returns a ContextSelection with the rendered products and debug info.
+        """
+        if not self.catalog_index or not user_question or self.top_k <= 0:
+            return ContextSelection(self.product_data, self.catalog_index.chunks if self.catalog_index else [])
+        if max_tokens is None:
+            max_tokens = self.max_context_tokens
+        facet_filter = self.facets.parse(user_question) if self.facets else None
+        if facet_filter is not None and not facet_filter.empty:
+            matches = self.facets.match(facet_filter)
+            # A filter nothing matches, or whose products don't fit, is more likely misread
+            # than meant; retrieve as usual then
+            if matches:
+                context = self.catalog_index.select(user_question, top_k=self.top_k, max_tokens=max_tokens,
+                                                    candidates=self._filtered_candidates(user_question, matches))
+                if context.chunks:
+                    context.facets = {**facet_filter.as_dict(), "matches": len(matches)}
+                    return context
+        candidates = self.retriever.search(user_question, self.top_k) if self.retriever else None
+        return self.catalog_index.select(user_question, top_k=self.top_k, max_tokens=max_tokens,
+                                         candidates=candidates)
+    
+    def _filtered_candidates(self, user_question, matches):
+        """
+        (chunk, score) pairs for the products in a product_facets.FacetMatches only: those
+        the retriever ranks first, then the rest cheapest first (score 0), so a filter like
+        "under Rs 500" still fills the context when few of its products share words with
+        the question. Chunks are cut down to the rows of the variants that matched.
+        Products the question names come first whether or not they match: a category
+        inside a product's name ("Armor roofing sheets") isn't meant as a filter.
+        """
+        keys = matches.keys
+        allowed = set(keys)
+        searcher = self.retriever or self.catalog_index
+        results = searcher.search(user_question, len(self.catalog_index.chunks))
+        text = f" {normalize_name(user_question)} "
+        named = [(chunk, score) for chunk, score in results
+                 if chunk.key in self.facets.store.by_url and f" {normalize_name(chunk.title)} " in text]
+        ranked = [(chunk, score) for chunk, score in results if chunk.key in allowed]
+        seen = {chunk.key for chunk, _ in ranked}
+        chunks_by_key = {chunk.key: chunk for chunk in self.catalog_index.chunks}
+        ranked.extend((chunks_by_key[key], 0.0) for key in keys if key in chunks_by_key and key not in seen)
+        codes = matches.variant_codes
+        ranked = [(self.catalog_index.narrow(chunk, codes[chunk.key]) if chunk.key in codes else chunk, score)
+                  for chunk, score in ranked]
+        named_keys = {chunk.key for chunk, _ in named}
+        return named + [(chunk, score) for chunk, score in ranked if chunk.key not in named_keys]
+    
+    def get_system_prompt(self, user_question=None, context=None):
         """Generate the system prompt with product data and instructions."""
         if not self.product_data:
             return "Error: No product data available."
         
+        if context is None:
+            context = self.select_context(user_question)
+        
         return f"""
-        You are a product information assistant. Below is the product catalog information:
+        You are a product information assistant. Below is the product catalog information relevant to the question:
         
-        {self.product_data}
+        {context.text or "No matching products were found in the catalog."}
         
         Instructions for answering:
         1. Answer questions only based on the product information provided above.
@@ -55,64 +167,177 @@ class ProductRAG:
         9. Use markdown formatting when appropriate to make your response more readable.
         """
     
-    async def query(self, user_question):
+    def build_messages(self, user_question, history=None, debug=None):
+        """
+        Build the chat messages for a question within the prompt token budget.
+        History gets at most `history_share` of the budget left after the
+        instructions and question; older turns that don't fit are summarized.
+        The catalog context gets whatever history leaves, capped at max_context_tokens.
+        """
+        history = [message for message in history or [] if message.get("content")]
+        empty_context = ContextSelection("", [])
+        budget = PromptBudget(self.max_prompt_tokens,
+                              estimate_tokens(self.get_system_prompt(context=empty_context)),
+                              estimate_tokens(user_question),
+                              0)
+        budget.history_limit = int(budget.available * self.history_share) if history else 0
+        
+        kept, summary, budget.history_used, budget.summarized_turns = fit_history(history, budget.history_limit)
+        budget.history_turns = len(kept)
+        budget.catalog_limit = max(0, min(self.max_context_tokens, budget.available - budget.history_used))
+        
+        context = self.select_context(retrieval_query(user_question, history), budget.catalog_limit)
+        budget.catalog_used = context.tokens
+        print(f"Prompt budget - {budget}")
+        if debug is not None:
+            debug.update(context.debug_info())
+            debug["budget"] = budget.as_dict()
+        
+        messages = [{"role": "system", "content": self.get_system_prompt(user_question, context)}]
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(kept)
+        messages.append({"role": "user", "content": user_question})
+        return messages
+    
+    def answer_key(self, user_question, history=None):
+        """Cache and single-flight key of a question (with its chat history) on this catalog."""
+        return cache_key(user_question, self.catalog_version, history)
+    
+    def has_answer(self, key):
+        """
+        Whether the question with this answer_key() can be answered without an upstream call of
+        its own: its answer is cached, or an identical question is already streaming (single-flight).
+        """
+        if self.single_flight is not None and self.single_flight.is_inflight(key):
+            return True
+        return self.cache is not None and self.cache.contains(key)
+    
+    async def query(self, user_question, history=None, debug=None):
         """
         Query the product information based on user question.
         Uses OpenAI API to generate a response based on the product data.
+        `history` is the earlier messages of the chat ({"role", "content"} dicts).
+        If a `debug` dict is passed it is filled with the selected products.
         """
         if not self.product_data:
             return "Error: No product data available. Please check the markdown file."
         
-        system_prompt = self.get_system_prompt()
+        key = self.answer_key(user_question, history)
+        cached = self.cache.get(key) if self.cache else None
+        if debug is not None:
+            debug["cache"] = "hit" if cached is not None else "miss"
+        if cached is not None:
+            return cached
+        
+        messages = self.build_messages(user_question, history, debug)
         
+        if self.limiter:
+            await self.limiter.acquire()
+        started = time.monotonic()
+        failed = False
+        attempts = debug.setdefault("llm_attempts", []) if debug is not None else None
         try:
-            # Call OpenAI API
-            response = await client.chat.completions.create(
-                model="gpt-4o",  
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_question}
-                ],
-                temperature=0.1  # Lower temperature for more factual responses
-            )
-            
-            # Return the assistant's response
-            return response.choices[0].message.content
+            # Lower temperature for more factual responses
+            answer = await self.llm.complete(messages, temperature=0.1, attempts=attempts)
+            if self.cache and answer:
+                self.cache.set(key, answer)
+            return answer
+        
+        except LLMUnavailable as e:
+            failed = True
+            print(f"Error querying LLM: {e}")
+            return UNAVAILABLE_MESSAGE
         
         except Exception as e:
-            print(f"Error querying OpenAI API: {e}")
+            failed = True
+            print(f"Error querying LLM: {e}")
             return f"Error processing your request: {str(e)}"
+        
+        finally:
+            if self.limiter:
+                self.limiter.release(time.monotonic() - started, failed)
     
-    async def stream_query(self, user_question) -> AsyncGenerator[str, None]:
+    async def stream_query(self, user_question, history=None, debug=None, admitted=False,
+                           trace=NULL_TRACE) -> AsyncGenerator[str, None]:
         """
         Stream the response from OpenAI API for a given user question.
+        `history` is the earlier messages of the chat ({"role", "content"} dicts).
+        If a `debug` dict is passed it is filled with the selected products.
+        `admitted=True` means the caller already holds a limiter slot for this request.
+        `trace` is a metrics.RequestTrace that gets the prompt-building span and counters.
         """
         if not self.product_data:
             yield "Error: No product data available. Please check the markdown file."
             return
         
-        system_prompt = self.get_system_prompt()
+        # Cache hits are replayed as a stream so callers see the same shape either way
+        key = self.answer_key(user_question, history)
+        cached = self.cache.get(key) if self.cache else None
+        if debug is not None:
+            debug["cache"] = "hit" if cached is not None else "miss"
+        if self.cache:
+            trace.count("cache", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            for piece in replay_chunks(cached):
+                yield piece
+            return
+        
+        with trace.span("prompt_build"):
+            messages = self.build_messages(user_question, history, debug)
+        if trace.enabled:
+            trace.set("prompt_tokens", sum(estimate_tokens(message["content"]) for message in messages))
+        
+        if self.single_flight is None:
+            upstream = self._stream_upstream(key, messages, admitted, debug)
+        else:
+            # Identical questions on the same catalog share one upstream stream
+            if debug is not None:
+                debug["single_flight"] = "joined" if self.single_flight.is_inflight(key) else "leader"
+            upstream = self.single_flight.stream(key, lambda: self._stream_upstream(key, messages, admitted, debug))
         
+        async for chunk in upstream:
+            yield chunk
+    
+    async def _stream_upstream(self, key, messages, admitted=False, debug=None) -> AsyncGenerator[str, None]:
+        """
+        Stream one answer from the LLM and cache it once complete.
+        `debug` gets the LLM attempts and, if the answer failed, an `error` entry.
+        """
+        limiter = None if admitted else self.limiter
+        if limiter:
+            await limiter.acquire()
+        started = time.monotonic()
+        failed = False
+        attempts = debug.setdefault("llm_attempts", []) if debug is not None else None
         try:
-            # Call OpenAI API with streaming
-            stream = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_question}
-                ],
-                temperature=0.1,
-                stream=True
-            )
+            # Yield each piece of text as it arrives
+            parts = []
+            async for text in self.llm.stream(messages, temperature=0.1, attempts=attempts):
+                parts.append(text)
+                yield text
             
-            # Yield each chunk as it arrives
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    
+            # Only complete answers are cached; errors and abandoned streams are not
+            if self.cache and parts:
+                self.cache.set(key, "".join(parts))
+        
+        except LLMUnavailable as e:
+            failed = True
+            print(f"Error streaming from LLM: {e}")
+            if debug is not None:
+                debug["error"] = str(e)
+            yield UNAVAILABLE_MESSAGE
+        
         except Exception as e:
-            print(f"Error streaming from OpenAI API: {e}")
+            failed = True
+            print(f"Error streaming from LLM: {e}")
+            if debug is not None:
+                debug["error"] = str(e)
             yield f"Error processing your request: {str(e)}"
+        
+        finally:
+            if limiter:
+                limiter.release(time.monotonic() - started, failed)
 
 # Example usage with async
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import csv
+import json
+import re
+
+from catalog_index import split_markdown_catalog
+
+NAME_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    """Lowercase a product name and collapse punctuation, e.g. 'Conduit Pipes-SLS' -> 'conduit pipes sls'."""
+    return NAME_PATTERN.sub(" ", (name or "").lower()).strip()
+
+
+def parse_price(value):
+    """Parse 2150.0, '2,150.00 LKR' or 'Rs.2,150.00' into a float; None if there is no number."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(value))
+    return float(match.group(0).replace(",", "")) if match else None
+
+
+def parse_stock(value):
+    """Parse True, 'True', 'in stock' or 'out of stock' into a bool; None if the value doesn't say."""
+    if isinstance(value, bool):
+        return value
+    text = normalize_name(str(value)) if value is not None else ""
+    if text in ("true", "yes", "1", "in stock", "available"):
+        return True
+    if text in ("false", "no", "0", "out of stock", "unavailable", "sold out"):
+        return False
+    return None
+
+
+# Spellings that appear in the source data for the same color
+COLOR_ALIASES = {"gray": "grey", "emerld": "emerald", "teakwood": "teak"}
+
+
+def normalize_color(value):
+    """
+    The color name in a variant color string, e.g. 'EMERALD GREEN - 25PC BOX' -> 'emerald green',
+    '90 - WHITE' -> 'white', 'BLACK (15M)' -> 'black'; '' if there is none.
+    Parts with digits (pack sizes, lengths, codes) are dropped.
+    """
+    text = re.sub(r"\([^)]*\)", " ", (value or "").lower())
+    for part in text.split("-"):
+        words = [COLOR_ALIASES.get(word, word) for word in normalize_name(part).split()]
+        if words and not any(any(ch.isdigit() for ch in word) for word in words):
+            return " ".join(words)
+    return ""
+
+
+def format_price(price):
+    return f"Rs. {price:,.2f}" if price is not None else "price not listed"
+
+
+class Variant:
+    def __init__(self, product_code, size=None, unit=None, color=None, price=None):
+        self.product_code = str(product_code) if product_code else ""
+        self.size = size or ""
+        self.unit = unit or ""
+        self.color = color or ""
+        self.price = price
+
+    def label(self):
+        return " / ".join(part for part in (self.color, self.size) if part) or self.product_code
+
+
+class Product:
+    def __init__(self, url, name, description="", price=None):
+        self.url = url
+        self.name = name
+        self.description = description or ""
+        self.price = price
+        self.category = ""
+        # None means the source data does not say
+        self.in_stock = None
+        self.variants = []
+
+
+class ProductStore:
+    """
+    Structured in-memory product store.
+    Hash indexes on product code, URL and normalized product name make exact
+    lookups O(1), so simple questions can be answered without the LLM.
+    """
+
+    def __init__(self):
+        self.products = []
+        self.by_url = {}
+        self.by_code = {}
+        self.by_name = {}
+
+    def _add_product(self, product):
+        self.products.append(product)
+        self.by_url[product.url] = product
+        self.by_name.setdefault(normalize_name(product.name), []).append(product)
+
+    def _add_variant(self, product, variant):
+        if not variant.product_code or variant.product_code in self.by_code:
+            return
+        product.variants.append(variant)
+        self.by_code[variant.product_code] = (product, variant)
+
+    def load_json(self, json_file_path):
+        """Load products and variants from anton_products.json."""
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        for item in data:
+            product_data = item.get("product_data", {})
+            url = item.get("url", "")
+            product = self.by_url.get(url)
+            if product is None:
+                product = Product(url, product_data.get("main_product", ""),
+                                  product_data.get("product_description", ""),
+                                  parse_price(product_data.get("main_product_price")))
+                self._add_product(product)
+            for variant in product_data.get("product_variants", []):
+                if isinstance(variant, dict):
+                    self._add_variant(product, Variant(variant.get("product_code"), variant.get("size"),
+                                                       variant.get("unit"), variant.get("color"),
+                                                       parse_price(variant.get("price"))))
+        return self
+
+    def load_csv(self, csv_file_path):
+        """Add any products or variants from anton_products.csv that the JSON did not have."""
+        with open(csv_file_path, "r", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                url = row.get("url", "")
+                product = self.by_url.get(url)
+                if product is None:
+                    product = Product(url, row.get("main_product", ""), row.get("product_description", ""),
+                                      parse_price(row.get("main_product_price")))
+                    self._add_product(product)
+                self._add_variant(product, Variant(row.get("product_code"), row.get("size"), row.get("unit"),
+                                                   None, parse_price(row.get("variant_price"))))
+        return self
+
+    def load_catalog_markdown(self, markdown):
+        """Fill in category and stock status from the product_catalog.md table."""
+        header, chunks = split_markdown_catalog(markdown)
+        if not header:
+            return self
+        columns = [cell.strip().lower() for cell in header.splitlines()[0].strip().strip("|").split("|")]
+        for chunk in chunks:
+            if not chunk.is_table or chunk.key not in self.by_url:
+                continue
+            product = self.by_url[chunk.key]
+            for line in chunk.text.splitlines():
+                row = dict(zip(columns, (cell.strip() for cell in line.strip().strip("|").split("|"))))
+                if row.get("product_category"):
+                    product.category = row["product_category"]
+                in_stock = parse_stock(row.get("in_stock"))
+                if in_stock is not None:
+                    # A product counts as in stock if any of its rows is
+                    product.in_stock = bool(product.in_stock) or in_stock
+        return self
+
+    def find_by_name(self, name):
+        return self.by_name.get(normalize_name(name), [])
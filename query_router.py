@@ -0,0 +1,192 @@
+import re
+from typing import AsyncGenerator
+
+from metrics import NULL_TRACE
+from product_store import format_price, normalize_name
+
+URL_PATTERN = re.compile(r"https?://\S+")
+CODE_PATTERN = re.compile(r"\b\d{4,7}\b")
+
+# Keywords that mark a question as a simple lookup, per answer template
+INTENT_KEYWORDS = {
+    "price": ("price", "prices", "cost", "how much", "rate"),
+    "stock": ("in stock", "available", "availability", "stock"),
+    "colors": ("color", "colors", "colour", "colours"),
+    "url": ("link", "url", "website", "where can i buy", "where to buy"),
+}
+
+# Words a pure lookup may contain besides the product and the intent keywords; anything
+# else ("sizes", "weigh", "suitable for metal roofs") is a question the fast path can't answer
+LOOKUP_WORDS = {
+    "a", "about", "an", "and", "are", "at", "can", "code", "come", "comes", "currently", "do", "does",
+    "for", "get", "give", "how", "i", "in", "is", "it", "its", "me", "much", "now", "of", "please",
+    "product", "s", "show", "tell", "that", "the", "there", "this", "what", "whats", "you", "your",
+}
+
+
+class RouteDecision:
+    """Result of routing a question: a ready answer from the fast path, or None for the LLM."""
+
+    def __init__(self, source, answer=None, reason=""):
+        self.source = source
+        self.answer = answer
+        self.reason = reason
+
+
+class QueryRouter:
+    """
+    Sits in front of ProductRAG and answers exact lookups (price, stock, colors,
+    link for a product code, URL or product name) from the ProductStore, and,
+    with a product_facets.FacetIndex, list requests like "roofing sheets under
+    Rs 10,000 in royal blue". Anything ambiguous or open-ended falls back to the LLM.
+    """
+
+    def __init__(self, rag, store, facets=None):
+        self.rag = rag
+        self.store = store
+        self.facets = facets
+        self.stats = {"fast_path": 0, "llm": 0}
+        # Longest names first so "conduit pipes sls" wins over "conduit"
+        self.names = sorted(store.by_name, key=len, reverse=True)
+
+    def _intents(self, question):
+        text = f" {normalize_name(question)} "
+        return [intent for intent, keywords in INTENT_KEYWORDS.items()
+                if any(f" {keyword} " in text for keyword in keywords)]
+
+    def _resolve(self, question):
+        """
+        Find the single product (and variant, if a code was given) the question is about.
+        Returns (product, variant, reason); product is None when nothing or several things match.
+        """
+        urls = [url.rstrip(".,?!)") for url in URL_PATTERN.findall(question)]
+        codes = [code for code in CODE_PATTERN.findall(question) if code in self.store.by_code]
+        if urls or codes:
+            matches = {}
+            for url in urls:
+                if url in self.store.by_url:
+                    matches[url] = (self.store.by_url[url], None)
+            for code in codes:
+                product, variant = self.store.by_code[code]
+                matches[product.url + "#" + code] = (product, variant)
+            if len(matches) != 1:
+                return None, None, "no exact match" if not matches else "several products referenced"
+            product, variant = next(iter(matches.values()))
+            return product, variant, "matched by code" if variant else "matched by url"
+
+        text = f" {normalize_name(question)} "
+        found = [name for name in self.names if name and f" {name} " in text]
+        if not found:
+            return None, None, "no product named"
+        name = found[0]
+        products = self.store.by_name[name]
+        if len(products) > 1:
+            return None, None, f"{len(products)} products named {name!r}"
+        # "conduit" inside "conduit bends" means the user probably wants a longer-named product
+        remaining = set(text.split()) - set(name.split())
+        for other in self.names:
+            if other != name and other.startswith(name + " ") and remaining & set(other[len(name):].split()):
+                return None, None, f"{name!r} could also be {other!r}"
+        if any(other not in name for other in found[1:]):
+            return None, None, "several products named"
+        return products[0], None, "matched by name"
+
+    def _leftover(self, question, intents, product):
+        """Words of the question that are not the product, its code or URL, an intent keyword or filler."""
+        text = CODE_PATTERN.sub(" ", URL_PATTERN.sub(" ", question))
+        allowed = LOOKUP_WORDS | set(normalize_name(product.name).split())
+        for intent in intents:
+            for keyword in INTENT_KEYWORDS[intent]:
+                allowed |= set(keyword.split())
+        return [word for word in normalize_name(text).split() if word not in allowed]
+
+    def _answer(self, intents, product, variant):
+        variants = [variant] if variant else product.variants
+        lines = [f"**{product.name}**" + (f" (product code {variant.product_code})" if variant else "")]
+
+        if "price" in intents:
+            prices = [(v, v.price) for v in variants if v.price is not None]
+            if len({price for _, price in prices}) == 1:
+                lines.append(f"- Price: {format_price(prices[0][1])}")
+            elif prices:
+                lines.append("- Prices:")
+                lines.extend(f"  - {v.label()} ({v.product_code}): {format_price(price)}" for v, price in prices)
+            else:
+                lines.append(f"- Price: {format_price(product.price)}")
+        if "colors" in intents:
+            colors = sorted({v.color for v in variants if v.color})
+            lines.append(f"- Colors: {', '.join(colors)}" if colors else "- Colors: not listed for this product")
+
+        if product.in_stock is None:
+            lines.append("- Stock: please check the product page for availability")
+        else:
+            lines.append(f"- Stock: {'In stock' if product.in_stock else 'Out of stock'}")
+        lines.append(f"- Link: {product.url}")
+        return "\n".join(lines)
+
+    def _list(self, question):
+        """A fast-path decision listing the products a pure filter question asks for, or None."""
+        if self.facets is None:
+            return None
+        facet_filter = self.facets.parse(question)
+        if not facet_filter.is_list_request:
+            return None
+        matches = self.facets.match(facet_filter)
+        if not matches:
+            # Leave it to the LLM, which may still find something close in the retrieved products
+            return None
+        return RouteDecision("fast_path", self.facets.render_list(facet_filter, matches),
+                             f"listed {len(matches)} products: {facet_filter.describe()}")
+
+    def route(self, question, history=None):
+        """
+        Decide how to answer a question. Fast-path decisions carry the finished answer.
+        `history` is the chat so far: a follow-up ("and in blue?") is never answered with
+        a list, since what it filters depends on the earlier turns.
+        """
+        question = question or ""
+        intents = self._intents(question)
+        product, variant, reason = self._resolve(question)
+        if intents and product is not None:
+            if "stock" in intents and product.in_stock is None and len(intents) == 1:
+                return RouteDecision("llm", reason="stock status unknown")
+            leftover = self._leftover(question, intents, product)
+            if leftover:
+                return RouteDecision("llm", reason=f"more than a lookup: {' '.join(leftover[:5])}")
+            return RouteDecision("fast_path", self._answer(intents, product, variant), reason)
+        # A question naming a product, even ambiguously, is about that product, not a list
+        if reason == "no product named" and not history:
+            listing = self._list(question)
+            if listing is not None:
+                return listing
+        return RouteDecision("llm", reason=reason if intents else "not a lookup question")
+
+    async def stream_query(self, user_question, history=None, debug=None, admitted=False,
+                           trace=NULL_TRACE, decision=None) -> AsyncGenerator[str, None]:
+        """
+        Same interface as ProductRAG.stream_query.
+        `debug`, if given, gets a `source` key of "fast_path" or "llm".
+        `decision` is the RouteDecision of a caller that already routed this question.
+        """
+        if decision is None:
+            decision = self.route(user_question, history)
+        self.stats[decision.source] += 1
+        if debug is not None:
+            debug["source"] = decision.source
+            debug["route_reason"] = decision.reason
+        if decision.source == "fast_path":
+            yield decision.answer
+            return
+        async for chunk in self.rag.stream_query(user_question, history=history, debug=debug, admitted=admitted,
+                                                 trace=trace):
+            yield chunk
+
+    async def query(self, user_question, history=None, debug=None):
+        decision = self.route(user_question, history)
+        self.stats[decision.source] += 1
+        if debug is not None:
+            debug["source"] = decision.source
+            debug["route_reason"] = decision.reason
+        if decision.source == "fast_path":
+            return decision.answer
+        return await self.rag.query(user_question, history=history, debug=debug)
@@ -0,0 +1,97 @@
+import asyncio
+
+
+class SharedStream:
+    """
+    One upstream async generator, fanned out to any number of subscribers.
+    Emitted chunks are kept until the stream finishes, so a subscriber that
+    joins late first receives the prefix it missed and then follows live.
+    When the last subscriber leaves before the end, the upstream is cancelled.
+    """
+
+    def __init__(self, source):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancelled = False
+        self.condition = asyncio.Condition()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                async with self.condition:
+                    self.chunks.append(chunk)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    async def subscribe(self):
+        """Yield every chunk of the stream from the beginning."""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(lambda: len(self.chunks) > index or self.done)
+                    pending = self.chunks[index:]
+                    finished = self.done
+                for chunk in pending:
+                    yield chunk
+                index += len(pending)
+                if finished and index >= len(self.chunks):
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.subscribers -= 1
+            # Nobody is reading any more: stop paying for upstream tokens
+            if self.subscribers == 0 and not self.done:
+                self.cancelled = True
+                self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent generations.
+    The first caller for a key starts the upstream stream; callers arriving
+    while it is still running share it instead of starting their own.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+        self.started = 0
+        self.joined = 0
+
+    def is_inflight(self, key):
+        return key in self.inflight
+
+    async def stream(self, key, source_factory):
+        """
+        Yield the chunks for `key`, calling source_factory() to create the
+        upstream async generator only if no identical stream is in flight.
+        """
+        shared = self.inflight.get(key)
+        if shared is None or shared.cancelled:
+            shared = SharedStream(source_factory())
+            self.inflight[key] = shared
+            self.started += 1
+
+            # Forget the stream as soon as it finishes, so later requests start fresh
+            def forget(_task):
+                if self.inflight.get(key) is shared:
+                    del self.inflight[key]
+            shared.task.add_done_callback(forget)
+        else:
+            self.joined += 1
+
+        async for chunk in shared.subscribe():
+            yield chunk
+
+    def stats(self):
+        return {"inflight": len(self.inflight), "started": self.started, "joined": self.joined}
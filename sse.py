@@ -0,0 +1,90 @@
+import asyncio
+import os
+from typing import AsyncGenerator
+
+# Tokens arriving within this window are sent as one frame; 0 sends every token as it comes
+COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_MS", "30")) / 1000
+# A frame is sent early once it holds this many characters
+MAX_FRAME_CHARS = int(os.getenv("SSE_MAX_FRAME_CHARS", "2048"))
+# An SSE comment is sent after this many idle seconds so proxies keep the connection open
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+HEARTBEAT = ": keep-alive\n\n"
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+async def coalesce(chunks, window=COALESCE_SECONDS, max_chars=MAX_FRAME_CHARS,
+                   heartbeat=None) -> AsyncGenerator[str, None]:
+    """
+    Join a stream of text chunks into larger pieces.
+    The first text is yielded as soon as it arrives, so coalescing never adds
+    to time-to-first-token; after that, chunks that arrive within `window`
+    seconds of the first unsent one are yielded together (early once they
+    reach `max_chars`). With `heartbeat` set,
+    None is yielded whenever nothing has been yielded for that many seconds,
+    including before the first chunk. Errors from `chunks` are raised after
+    the text received so far is yielded; closing this generator cancels `chunks`.
+    """
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+        except Exception as e:
+            queue.put_nowait(_Failed(e))
+        finally:
+            queue.put_nowait(_DONE)
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(pump())
+    buffer = []
+    size = 0
+    deadline = None
+    last_sent = loop.time()
+    sent_text = False
+    try:
+        while True:
+            if buffer:
+                timeout = max(0.0, deadline - loop.time())
+            else:
+                timeout = max(0.0, last_sent + heartbeat - loop.time()) if heartbeat else None
+            try:
+                item = queue.get_nowait() if not queue.empty() else await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is None or item is _DONE or isinstance(item, _Failed):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size, deadline = [], 0, None
+                elif item is None:
+                    yield None
+                last_sent = loop.time()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                continue
+
+            buffer.append(item)
+            size += len(item)
+            if deadline is None:
+                deadline = loop.time() + window
+            if size >= max_chars or window <= 0 or (size and not sent_text):
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                last_sent = loop.time()
+                sent_text = True
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
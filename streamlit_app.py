@@ -1,26 +1,38 @@
 import os
+import queue
+import threading
 import streamlit as st
 import asyncio
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 from typing import AsyncGenerator
 import time
 
+from catalog_index import CatalogIndex, ContextSelection
+from llm_client import LLMUnavailable, create_llm
+from llm_providers import default_providers, openrouter_provider
+
 # Load environment variables
 load_dotenv()
 
+CATALOG_PATH = os.getenv("STREAMLIT_CATALOG_PATH", "anton_csv_products.md")
+# Redraw the streaming answer at most this often; tokens in between are shown together
+UI_UPDATE_SECONDS = float(os.getenv("STREAMLIT_UI_UPDATE_MS", "100")) / 1000
+
 #---------------------------------------------
 # RAG Backend Implementation
 #---------------------------------------------
 class RAGBackend:
-    def __init__(self, markdown_file_path=None, markdown_content=None):
+    def __init__(self, markdown_file_path=None, markdown_content=None,
+                 top_k=int(os.getenv("RAG_TOP_K", "8")),
+                 max_context_tokens=int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "6000")), llm=None):
         """
         Initialize the RAG system with product data.
         Either provide a file path or markdown content directly.
+        The catalog is split into per-product chunks and indexed once here.
+        `llm` is an optional llm_client.ResilientLLM; by default Gemini on OpenRouter
+        (or the offline mock with LLM_PROVIDER=mock).
         """
-        # Create async OpenAI client
-        self.client = AsyncOpenAI(base_url="https://openrouter.ai/api/v1",
-                                  api_key=os.getenv("OPENROUTER_API_KEY"))
+        self.llm = llm or create_llm(default_providers(lambda: openrouter_provider("google/gemini-2.0-flash-001")))
         
         self.markdown_file_path = markdown_file_path
         if markdown_content:
@@ -29,6 +41,10 @@ class RAGBackend:
             self.product_data = self._load_markdown_file()
         else:
             self.product_data = ""
+        
+        self.top_k = top_k
+        self.max_context_tokens = max_context_tokens
+        self.catalog_index = CatalogIndex(self.product_data) if self.product_data else None
     
     def _load_markdown_file(self):
         """Load and read the markdown file."""
@@ -39,17 +55,29 @@ class RAGBackend:
             print(f"Error loading markdown file: {e}")
             return ""
     
-    def get_system_prompt(self, user_question=None):
+    def select_context(self, user_question=None):
+        """
+        Pick the catalog context for a question.
+        Returns a ContextSelection with the rendered products and debug info.
+        """
+        if not self.catalog_index or not user_question or self.top_k <= 0:
+            return ContextSelection(self.product_data, self.catalog_index.chunks if self.catalog_index else [])
+        return self.catalog_index.select(user_question, top_k=self.top_k, max_tokens=self.max_context_tokens)
+    
+    def get_system_prompt(self, user_question=None, context=None):
         """Generate the system prompt with product data and instructions."""
         if not self.product_data:
             return "Error: No product data available."
         
+        if context is None:
+            context = self.select_context(user_question)
+        
         return f"""
         You are the anton product and company information assistant. Below is the product catalog information and some company information:
 
         ==<|STARTOF_ANTON_DATA|>==
         
-        {self.product_data}
+        {context.text or "No matching products were found in the catalog."}
 
         ==<|ENDOF_ANTON_DATA|>==
         
@@ -79,25 +107,22 @@ class RAGBackend:
         else:
             user_question = str(user_question)
             
-        system_prompt = self.get_system_prompt()
+        system_prompt = self.get_system_prompt(user_question)
         
         # Ensure system_prompt is not None
         if system_prompt is None:
             system_prompt = "You are a helpful assistant."
         
         try:
-            # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model="google/gemini-2.0-flash-001",  
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_question}
-                ],
-                temperature=0.1  # Lower temperature for more factual responses
-            )
-            
-            # Return the assistant's response
-            return response.choices[0].message.content
+            # Lower temperature for more factual responses
+            return await self.llm.complete([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_question}
+            ], temperature=0.1)
+        
+        except LLMUnavailable as e:
+            print(f"Error querying API: {e}")
+            return "Sorry, the assistant is temporarily unavailable. Please try again in a moment."
         
         except Exception as e:
             print(f"Error querying API: {e}")
@@ -128,12 +153,14 @@ class RAGBackend:
             user_question = "Hello"  # Another fallback
 
         # Get and validate system prompt
-        system_prompt = self.get_system_prompt()
+        context = self.select_context(user_question)
+        system_prompt = self.get_system_prompt(user_question, context)
         if not system_prompt or system_prompt == "Error: No product data available.":
             system_prompt = "You are a helpful assistant with knowledge about anton Product Information."
         
         # Debug the message payload
         print(f"Debug - system_prompt length: {len(system_prompt)}")
+        print(f"Debug - selected products: {context.products}")
         print(f"Debug - Final user_question: '{user_question}'")
         
         # Create messages with extra validation
@@ -143,19 +170,13 @@ class RAGBackend:
         ]
         
         try:
-            # Call OpenAI API with streaming
-            stream = await self.client.chat.completions.create(
-                model="google/gemini-2.0-flash-001",
-                messages=messages,
-                temperature=0.1,
-                stream=True
-            )
-            
-            # Yield each chunk as it arrives
-            async for chunk in stream:
-                if (hasattr(chunk.choices[0].delta, 'content') and 
-                    chunk.choices[0].delta.content is not None):
-                    yield chunk.choices[0].delta.content
+            # Yield each piece of text as it arrives
+            async for text in self.llm.stream(messages, temperature=0.1):
+                yield text
+        
+        except LLMUnavailable as e:
+            print(f"Error streaming from API: {e}")
+            yield "Sorry, the assistant is temporarily unavailable. Please try again in a moment."
                     
         except Exception as e:
             print(f"Error streaming from OpenAI API: {e}")
@@ -165,6 +186,48 @@ class RAGBackend:
 # Streamlit UI Implementation
 #---------------------------------------------
 
+class BackgroundLoop:
+    """
+    One asyncio event loop running in a daemon thread for the whole process.
+    Streamlit runs each session's script in its own thread; instead of a fresh
+    asyncio.run per rerun, they all stream through this loop, so the LLM
+    clients and their connection pools are created once and reused.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="rag-event-loop", daemon=True)
+        self.thread.start()
+
+    def stream(self, chunks):
+        """
+        Iterate an async generator from a regular thread. Chunks are handed over
+        through a queue; closing the returned generator cancels the async one.
+        """
+        handoff = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in chunks:
+                    handoff.put(chunk)
+            except Exception as e:
+                handoff.put(e)
+            finally:
+                handoff.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = handoff.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
 def load_markdown_content(file_path):
     """Load content from a markdown file."""
     try:
@@ -174,10 +237,52 @@ def load_markdown_content(file_path):
         st.error(f"Error loading markdown file: {e}")
         return None
 
-def initialize_rag_backend(markdown_content):
-    """Initialize the RAG backend with markdown content."""
+@st.cache_resource(max_entries=1, show_spinner="Loading the product catalog...")
+def get_rag_backend(file_path, modified):
+    """
+    The RAG backend shared by every session in this process. It is read-only
+    after construction, so sessions can use it at the same time. `modified`
+    (the file's mtime) is part of the cache key, so an edited catalog is loaded
+    on the next rerun and the old one dropped.
+    """
+    markdown_content = load_markdown_content(file_path)
+    if not markdown_content:
+        return None
     return RAGBackend(markdown_content=markdown_content)
 
+@st.cache_resource
+def get_background_loop():
+    return BackgroundLoop()
+
+def current_rag_backend():
+    try:
+        modified = os.path.getmtime(CATALOG_PATH)
+    except OSError as e:
+        st.error(f"Error loading markdown file: {e}")
+        return None
+    return get_rag_backend(CATALOG_PATH, modified)
+
+def render_stream(chunks, write, interval=UI_UPDATE_SECONDS):
+    """
+    Show streamed text with write(text_so_far), at most once per `interval`
+    seconds plus once at the end. Returns the full text.
+    """
+    parts = []
+    shown = 0
+    last_write = 0.0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts.append(chunk)
+        now = time.monotonic()
+        if now - last_write >= interval:
+            write("".join(parts))
+            shown = len(parts)
+            last_write = now
+    if len(parts) != shown:
+        write("".join(parts))
+    return "".join(parts)
+
 def main():
     # Page config - Using centered layout with collapsed sidebar
     st.set_page_config(
@@ -224,19 +329,11 @@ def main():
     if "processing" not in st.session_state:
         st.session_state.processing = False
     
-    if "context_loaded" not in st.session_state:
-        # Load markdown content
-        markdown_content = load_markdown_content("anton_csv_products.md")
-        if not markdown_content:
-            st.error("Failed to load markdown content.")
-            st.stop()
-        
-        # Store the context in session state
-        st.session_state.markdown_context = markdown_content
-        st.session_state.context_loaded = True
-        
-        # Initialize RAG backend
-        st.session_state.rag_backend = initialize_rag_backend(markdown_content)
+    # The catalog and backend are loaded once per process and shared by all sessions
+    rag_backend = current_rag_backend()
+    if rag_backend is None:
+        st.error("Failed to load markdown content.")
+        st.stop()
     
     # Title area - simplified layout
     st.markdown("<h1 class='app-title'>Product Information Assistant</h1>", unsafe_allow_html=True)
@@ -334,39 +431,29 @@ def main():
         # Reference to update the last message
         last_idx = len(st.session_state.messages) - 1
         
+        def show(text):
+            # Update the placeholder and the message in session state
+            message_placeholder.write(text)
+            st.session_state.messages[last_idx]["content"] = text
+        
         try:
-            # Generate response using the RAG backend with validated user message
-            async def run_stream_query():
-                full_response = ""
-                try:
-                    async for text_chunk in st.session_state.rag_backend.stream_query(user_message):
-                        if text_chunk:  # Check if chunk is not empty
-                            full_response += text_chunk
-                            # Update the placeholder with the current response
-                            message_placeholder.write(full_response)
-                            
-                            # Update the message in session state
-                            st.session_state.messages[last_idx]["content"] = full_response
-                            status.update(label="Generating response...", state="running")
-                            time.sleep(0.01)  # Slight delay for UI updates
-                    
-                    # If we got an empty response, provide a fallback
-                    if not full_response:
-                        full_response = "I'm having trouble generating a response right now. Please try again."
-                        message_placeholder.write(full_response)
-                        st.session_state.messages[last_idx]["content"] = full_response
-                        
-                except Exception as e:
-                    print(f"Stream query error: {e}")
-                    full_response = f"Sorry, there was an error generating a response: {str(e)}"
-                    message_placeholder.write(full_response)
-                    st.session_state.messages[last_idx]["content"] = full_response
+            # Stream on the shared event loop; the placeholder is redrawn at most every UI_UPDATE_SECONDS
+            chunks = get_background_loop().stream(rag_backend.stream_query(user_message))
+            try:
+                full_response = render_stream(chunks, show)
                 
-                # Final update with complete response
-                status.update(label="Response complete!", state="complete")
+                # If we got an empty response, provide a fallback
+                if not full_response:
+                    show("I'm having trouble generating a response right now. Please try again.")
+                    
+            except Exception as e:
+                print(f"Stream query error: {e}")
+                show(f"Sorry, there was an error generating a response: {str(e)}")
+            finally:
+                chunks.close()
             
-            # Run the async function
-            asyncio.run(run_stream_query())
+            # Final update with complete response
+            status.update(label="Response complete!", state="complete")
             
             # Close status after a short delay
             time.sleep(0.5)
@@ -1,7 +1,10 @@
 import streamlit as st
 import requests
+import sseclient
 import json
+import os
 import time
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 
 # Set page config with a more modern look
@@ -55,14 +58,38 @@ if "current_message" not in st.session_state:
     st.session_state.current_message = None
 
 # API URL - change if needed
-API_URL = "http://localhost:8000"
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+# (connect, read) timeouts in seconds; the read timeout also bounds the wait between streamed events
+API_TIMEOUT = (float(os.getenv("API_CONNECT_TIMEOUT", "3")), float(os.getenv("API_READ_TIMEOUT", "30")))
+# Redraw the streaming answer at most this often; events in between are shown together
+UI_UPDATE_SECONDS = float(os.getenv("UI_UPDATE_MS", "100")) / 1000
+
+@st.cache_resource
+def get_http_session():
+    """One pooled HTTP session for every rerun and browser session, so API connections are kept alive and reused."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("API_POOL_SIZE", "32")))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def api_request(method, path, **kwargs):
+    return get_http_session().request(method, f"{API_URL}{path}", timeout=API_TIMEOUT, **kwargs)
 
 # Function to get all chats
 def get_chats():
+    # Ask for the list only if it changed since the copy we have (ETag / 304 Not Modified)
+    cached = st.session_state.get("chat_list")
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
     try:
-        response = requests.get(f"{API_URL}/api/chats")
+        response = api_request("GET", "/api/chats", headers=headers)
+        if response.status_code == 304 and cached:
+            return cached["chats"]
         if response.status_code == 200:
-            return response.json()
+            chats = response.json()
+            if response.headers.get("ETag"):
+                st.session_state.chat_list = {"etag": response.headers["ETag"], "chats": chats}
+            return chats
         else:
             return []
     except Exception as e:
@@ -72,7 +99,7 @@ def get_chats():
 # Function to get a specific chat
 def get_chat(chat_id):
     try:
-        response = requests.get(f"{API_URL}/api/chats/{chat_id}")
+        response = api_request("GET", f"/api/chats/{chat_id}")
         if response.status_code == 200:
             return response.json()
         else:
@@ -84,7 +111,7 @@ def get_chat(chat_id):
 # Function to create a new chat
 def create_chat():
     try:
-        response = requests.post(f"{API_URL}/api/chats")
+        response = api_request("POST", "/api/chats")
         if response.status_code == 200:
             return response.json()
         else:
@@ -96,7 +123,7 @@ def create_chat():
 # Function to delete a chat
 def delete_chat(chat_id):
     try:
-        response = requests.delete(f"{API_URL}/api/chats/{chat_id}")
+        response = api_request("DELETE", f"/api/chats/{chat_id}")
         return response.status_code == 200
     except Exception as e:
         st.error(f"Error connecting to API: {str(e)}")
@@ -107,87 +134,70 @@ def process_message(chat_id, content):
     # Create a status indicator
     status = st.status("Processing your request...", expanded=False)
     
-    # Create message via API
+    # Send the message and stream the answer in one request; the first event carries the ids
     try:
-        response = requests.post(
-            f"{API_URL}/api/messages",
-            json={"chat_id": chat_id, "content": content}
-        )
-        
-        if response.status_code != 200:
-            status.update(label="Failed to send message", state="error")
-            time.sleep(1)
-            st.session_state.processing = False
-            st.rerun()
-            return
-            
-        data = response.json()
-        new_chat_id = data["chat_id"]
-        message_id = data["message_id"]
-        
-        # If this is a new chat, update the chat_id
-        if chat_id is None or chat_id != new_chat_id:
-            st.session_state.chat_id = new_chat_id
-        
-        status.update(label="Generating response...", state="running")
-        
-        # Create a chat message container for the assistant's response
-        assistant_container = st.chat_message("assistant")
-        message_placeholder = assistant_container.empty()
-        
-        # Stream the response
-        try:
-            # Connect to the streaming endpoint
-            stream_response = requests.get(
-                f"{API_URL}/api/messages/{message_id}/stream",
-                params={"chat_id": new_chat_id},
-                stream=True
-            )
+        with api_request("POST", "/api/messages/stream",
+                         json={"chat_id": chat_id, "content": content}, stream=True) as stream_response:
             
             if stream_response.status_code != 200:
-                status.update(label="Error streaming response", state="error")
+                status.update(label="Failed to send message", state="error")
                 time.sleep(1)
                 st.session_state.processing = False
                 st.rerun()
                 return
             
-            # Process the streamed response
-            content_so_far = ""
+            status.update(label="Generating response...", state="running")
             
-            for line in stream_response.iter_lines():
-                if not line:
-                    continue
-                    
-                # SSE format: lines starting with "data: "
-                if line.startswith(b"data: "):
-                    data_str = line[6:].decode("utf-8")
-                    
+            # Create a chat message container for the assistant's response
+            assistant_container = st.chat_message("assistant")
+            message_placeholder = assistant_container.empty()
+            
+            # Stream the response
+            try:
+                # Events are parsed as their bytes arrive (chunk_size=None), not in fixed-size blocks
+                events = sseclient.SSEClient(stream_response.iter_content(chunk_size=None)).events()
+                content_so_far = ""
+                shown = ""
+                last_redraw = 0.0
+                
+                for event in events:
                     # Check for the [DONE] marker
-                    if data_str == "[DONE]":
+                    if event.data == "[DONE]":
                         break
-                        
+                    
                     try:
-                        data = json.loads(data_str)
-                        chunk = data.get("content", "")
-                        content_so_far += chunk
-                        
-                        # Update the message content in the chat message
-                        message_placeholder.write(content_so_far)
-                            
-                        # Update status to show progress
-                        status.update(label=f"Generating response...", state="running")
-                            
+                        data = json.loads(event.data)
                     except json.JSONDecodeError:
                         continue
-            
-            # Add the complete message to our messages list
-            st.session_state.messages.append({"role": "assistant", "content": content_so_far})
-            
-            # Update status to complete
-            status.update(label="Response complete!", state="complete")
-            
-        except Exception as e:
-            status.update(label=f"Error during streaming: {str(e)}", state="error")
+                    
+                    # If this is a new chat, update the chat_id
+                    if "chat_id" in data:
+                        st.session_state.chat_id = data["chat_id"]
+                        continue
+                    
+                    # A reset event carries the whole answer so far
+                    if data.get("reset"):
+                        content_so_far = ""
+                    content_so_far += data.get("content", "")
+                    
+                    # Update the message content, at most once per UI_UPDATE_SECONDS
+                    now = time.monotonic()
+                    if content_so_far != shown and now - last_redraw >= UI_UPDATE_SECONDS:
+                        message_placeholder.write(content_so_far)
+                        shown = content_so_far
+                        last_redraw = now
+                
+                if content_so_far != shown:
+                    message_placeholder.write(content_so_far)
+                
+                # Add the complete message to our messages list
+                st.session_state.messages.append({"role": "assistant", "content": content_so_far})
+                
+                # Update status to complete
+                status.update(label="Response complete!", state="complete")
+                
+            except Exception as e:
+                status.update(label=f"Error during streaming: {str(e)}", state="error")
             
     except Exception as e:
         status.update(label=f"Error connecting to API: {str(e)}", state="error")
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+from catalog_diff import CatalogDiff, record_hash
+
+# Where the embedding matrix and its id list are written by default
+DEFAULT_INDEX_DIR = "vector_index"
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def load_product_records(json_file_path):
+    """
+    Load the product records from anton_products.json.
+    Returns a list of dicts with the product URL as `key`, its name and the text to embed.
+    """
+    with open(json_file_path, "r", encoding="utf-8") as file:
+        products = json.load(file)
+    return [product_record(product) for product in products]
+
+
+def product_record(product):
+    """The record (key, title, text to embed) for one product from anton_products.json."""
+    product_data = product.get("product_data", {})
+    name = product_data.get("main_product", "") or ""
+    variants = [variant for variant in product_data.get("product_variants", []) if isinstance(variant, dict)]
+    variant_terms = set()
+    for variant in variants:
+        for field in ("size", "unit", "color", "product_code", "variant_type", "outer_layer_color"):
+            if variant.get(field):
+                variant_terms.add(str(variant[field]))
+    url = product.get("url", "")
+    # URL paths carry the category ("products/accessories/...") so they are embedded too
+    path_words = url.rsplit("/products/", 1)[-1].replace("-", " ").replace("/", " ")
+    text = " ".join([name, path_words, " ".join(sorted(variant_terms)),
+                     product_data.get("product_description", "") or ""])
+    return {"key": url, "title": name, "text": text}
+
+
+class Embedder:
+    """
+    Interface for turning texts into vectors.
+    Implementations return a float32 matrix of shape (len(texts), dimension)
+    with L2-normalized rows, so a dot product is the cosine similarity.
+    """
+
+    name = "embedder"
+    dimension = 0
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic offline embedder using the hashing trick.
+    Words and character n-grams of each word are hashed (crc32, so results are
+    stable across processes) into a fixed number of signed buckets.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimension=512, ngram_range=(3, 4), word_weight=2.0):
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+        self.word_weight = word_weight
+
+    def _features(self, text):
+        features = {}
+        for word in WORD_PATTERN.findall(text.lower()):
+            features[word] = features.get(word, 0.0) + self.word_weight
+            padded = f"<{word}>"
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for start in range(len(padded) - n + 1):
+                    gram = "#" + padded[start:start + n]
+                    features[gram] = features.get(gram, 0.0) + 1.0
+        return features
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                # Sublinear term frequency keeps long descriptions from dominating
+                matrix[row, digest % self.dimension] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class VectorIndex:
+    """
+    Dense vector index over product records.
+    Vectors live in a float32 .npy matrix that is memory-mapped on load and
+    searched with blocked NumPy dot products, so memory use stays flat as the
+    catalog grows. `product_hashes` (key -> hash of the embedded record) lets
+    updated() re-embed only the products that changed.
+    """
+
+    def __init__(self, keys, vectors, embedder, source_hash="", product_hashes=None):
+        self.keys = list(keys)
+        self.vectors = vectors
+        self.embedder = embedder
+        self.source_hash = source_hash
+        self.product_hashes = product_hashes or {}
+
+    @classmethod
+    def build(cls, records, embedder, source_hash=""):
+        vectors = embedder.embed([record["text"] for record in records])
+        return cls([record["key"] for record in records], vectors, embedder, source_hash,
+                   {record["key"]: record_hash(record) for record in records})
+
+    def updated(self, records, source_hash=""):
+        """
+        Index for a new set of records, embedding only the added and changed ones
+        and copying the other vectors. Returns (index, CatalogDiff).
+        """
+        product_hashes = {record["key"]: record_hash(record) for record in records}
+        if len(product_hashes) != len(records) or len(self.product_hashes) != len(self.keys):
+            # Repeated keys can't be matched up; embed everything
+            return VectorIndex.build(records, self.embedder, source_hash), CatalogDiff(added=list(product_hashes))
+        diff = CatalogDiff.between(self.product_hashes, product_hashes)
+
+        rows = {key: row for row, key in enumerate(self.keys)}
+        fresh = set(diff.added) | set(diff.changed)
+        vectors = np.empty((len(records), self.embedder.dimension), dtype=np.float32)
+        kept = [(position, rows[record["key"]]) for position, record in enumerate(records)
+                if record["key"] not in fresh]
+        if kept:
+            positions, old_rows = zip(*kept)
+            vectors[list(positions)] = np.asarray(self.vectors)[list(old_rows)]
+        embedded = [(position, record) for position, record in enumerate(records) if record["key"] in fresh]
+        if embedded:
+            positions, to_embed = zip(*embedded)
+            vectors[list(positions)] = self.embedder.embed([record["text"] for record in to_embed])
+        return VectorIndex(list(product_hashes), vectors, self.embedder, source_hash, product_hashes), diff
+
+    def save(self, index_dir=DEFAULT_INDEX_DIR):
+        """
+        Write vectors.npy and meta.json; the matrix is written before its metadata.
+        Both are written to temporary files and renamed into place, so several
+        worker processes building the index at once never see a partial file.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        vectors_path = os.path.join(index_dir, "vectors.npy")
+        with open(vectors_path + suffix, "wb") as file:
+            np.save(file, np.asarray(self.vectors, dtype=np.float32))
+        os.replace(vectors_path + suffix, vectors_path)
+
+        meta = {
+            "keys": self.keys,
+            "embedder": self.embedder.name,
+            "dimension": self.embedder.dimension,
+            "source_hash": self.source_hash,
+            "product_hashes": self.product_hashes,
+        }
+        meta_path = os.path.join(index_dir, "meta.json")
+        with open(meta_path + suffix, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(meta_path + suffix, meta_path)
+
+    @classmethod
+    def load(cls, embedder, index_dir=DEFAULT_INDEX_DIR):
+        """Memory-map a saved index. Returns None if it is missing or was built by another embedder."""
+        try:
+            with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Vector index not loaded from {index_dir}: {e}")
+            return None
+        if meta.get("embedder") != embedder.name or meta.get("dimension") != embedder.dimension:
+            return None
+        if vectors.shape != (len(meta["keys"]), embedder.dimension):
+            return None
+        return cls(meta["keys"], vectors, embedder, meta.get("source_hash", ""), meta.get("product_hashes"))
+
+    def scores_many(self, queries, block_size=4096):
+        """Cosine scores of every query against every row, shape (len(queries), len(keys))."""
+        query_vectors = self.embedder.embed(queries)
+        scores = np.empty((len(queries), len(self.keys)), dtype=np.float32)
+        for start in range(0, len(self.keys), block_size):
+            block = np.asarray(self.vectors[start:start + block_size])
+            scores[:, start:start + block.shape[0]] = query_vectors @ block.T
+        return scores
+
+    def search(self, query, top_k=5):
+        """Return the top_k (key, score) pairs for the query, best first."""
+        if not self.keys:
+            return []
+        scores = self.scores_many([query])[0]
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[i], float(scores[i])) for i in top]
+
+
+def _file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load_or_build_vector_index(json_file_path, embedder=None, index_dir=DEFAULT_INDEX_DIR):
+    """
+    Memory-map the saved index for the given product JSON. If the JSON has changed
+    since the index was saved, only added and changed products are embedded again;
+    a missing index (or one saved without product hashes) is built from scratch.
+    The CatalogDiff applied, if any, is left on the returned index as `diff`.
+    """
+    embedder = embedder or HashingEmbedder()
+    source_hash = _file_hash(json_file_path)
+    index = VectorIndex.load(embedder, index_dir)
+    diff = None
+    if index is None or index.source_hash != source_hash:
+        records = load_product_records(json_file_path)
+        if index is not None and index.product_hashes:
+            updated, diff = index.updated(records, source_hash)
+            print(f"Vector index updated: {diff}")
+        else:
+            updated = VectorIndex.build(records, embedder, source_hash)
+        updated.save(index_dir)
+        index = VectorIndex.load(embedder, index_dir)
+    index.diff = diff
+    return index
+
+
+class HybridRetriever:
+    """
+    Context selector for ProductRAG backed by the vector index.
+    Dense scores are fused with the catalog's BM25 scores (each scaled to [0, 1])
+    using `alpha` as the dense weight; alpha=1.0 is pure vector search.
+    Results are catalog chunks, so they can be passed to CatalogIndex.select.
+    """
+
+    def __init__(self, vector_index, catalog_index, alpha=0.6, candidate_pool=50):
+        self.vector_index = vector_index
+        self.catalog_index = catalog_index
+        self.alpha = alpha
+        self.candidate_pool = candidate_pool
+        self.chunks_by_key = {chunk.key: chunk for chunk in catalog_index.chunks}
+
+    def search(self, query, top_k=5):
+        dense = dict(self.vector_index.search(query, self.candidate_pool))
+        lexical = {}
+        if self.alpha < 1.0:
+            for doc_id, score in self.catalog_index.index.scores(query).items():
+                lexical[self.catalog_index.index.chunks[doc_id].key] = score
+
+        dense_max = max(dense.values(), default=0.0) or 1.0
+        lexical_max = max(lexical.values(), default=0.0) or 1.0
+        fused = {}
+        for key in set(dense) | set(lexical):
+            if key not in self.chunks_by_key:
+                continue
+            fused[key] = (self.alpha * max(dense.get(key, 0.0), 0.0) / dense_max
+                          + (1 - self.alpha) * lexical.get(key, 0.0) / lexical_max)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.chunks_by_key[key], score) for key, score in ranked]